@@ -64,7 +64,7 @@ class Welcome(MessageRoute):
         await message.answer(
             templates.WELCOME,
             parse_mode="MARKDOWN",
-            reply_markup=keyboards.MainKeyboard(),
+            reply_markup=keyboards.MainKeyboard.default(),
         )
         logger.info("Пользователь {} выполнил /start", message.from_user.id)
 
@@ -313,7 +313,8 @@ class SubscribeToMailing(MessageRoute):
     async def handle(self, message, state):
         await state.set_state(NewSub.hour)
         await message.answer(
-            "Выберите час:", reply_markup=keyboards.HourChoiceKeyboard()
+            "Выберите час:",
+            reply_markup=keyboards.HourChoiceKeyboard.default(),
         )
 
 
@@ -329,7 +330,8 @@ class SetMailingHour(CallbackRoute):
     async def handle(self, call, state):
         await state.update_data(hour=int(call.data))
         await call.message.edit_text(
-            "Выберите минуты:", reply_markup=keyboards.MinuteChoiceKeyboard()
+            "Выберите минуты:",
+            reply_markup=keyboards.MinuteChoiceKeyboard.default(),
         )
         await state.set_state(NewSub.minute)
 
@@ -379,7 +381,8 @@ class ChangeMailingTime(MessageRoute):
 
     async def handle(self, message, state):
         await message.answer(
-            "Выберите час:", reply_markup=keyboards.HourChoiceKeyboard()
+            "Выберите час:",
+            reply_markup=keyboards.HourChoiceKeyboard.default(),
         )
         await state.set_state(ChangeTime.hour)
 
@@ -399,7 +402,8 @@ class ChangeMailingHour(CallbackRoute):
         await state.update_data(hour=int(call.data))
         await state.set_state(ChangeTime.minute)
         await call.message.edit_text(
-            "Выберите минуты:", reply_markup=keyboards.MinuteChoiceKeyboard()
+            "Выберите минуты:",
+            reply_markup=keyboards.MinuteChoiceKeyboard.default(),
         )
 
 
@@ -455,7 +459,9 @@ class Errors(ErrorRoute):
         super().__init__(filter=(lambda *_: True), handler=self.handle)
 
     async def handle(self, update):
-        await update.message.answer_sticker(stickers.MAINTAINCE_STICKER)
+        await update.message.answer_sticker(
+            stickers.catalog().maintaince_sticker
+        )
         await update.message.answer(templates.MAINTAINCE_MESSAGE)
         logger.exception("Произошла непредвиденная ошибка!")
         return True
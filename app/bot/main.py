@@ -1,37 +1,111 @@
 """Инициализация и запуск бота"""
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 import aiohttp
 
 from app import config
+from app import stickers
 from app.bot.handlers import Logic
 from app.bot.polling import Polling
 from app.bot.task import MailingTask
-from app.db import AiosqliteConnection, Subscribers, create_db
+from app.db import (
+    AiosqliteConnection,
+    Autocommit,
+    GroupCommit,
+    Subscribers,
+    create_db,
+)
+from app.leases import Leases
+from app.locations import WeatherRegistry
 from app.logger import logger
-from app.weather import OwmWeather
+from app.metrics import register_handler_metrics, track_weather_cache
+from app.storage import SqliteStorage
+
+
+def create_bot(token, api_url=None):
+    """Бот, работающий с Telegram Bot API по адресу `api_url`"""
+    if api_url is None:
+        return Bot(token=token)
+    api = TelegramAPIServer.from_base(api_url)
+    return Bot(token=token, session=AiohttpSession(api=api))
+
+
+def create_storage(db_session, writes):
+    """Хранилище состояний FSM по конфигу"""
+    if config.FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return SqliteStorage(
+        db_session, writes, ttl=config.FSM_TTL, cache_ttl=config.FSM_CACHE_TTL
+    )
 
 
 @logger.catch(level="CRITICAL")
 async def main():
     """Главная функция, отвечающая за запуск бота и рассылки"""
-    bot = Bot(token=config.BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    bot = create_bot(config.BOT_TOKEN, config.TELEGRAM_API_URL)
 
     logger.info("Запуск")
 
     async with AiosqliteConnection(
         config.DATABASE_URL
-    ) as db_session, aiohttp.ClientSession() as client_session:
+    ) as db_session, AiosqliteConnection(
+        config.DATABASE_URL
+    ) as leases_session, aiohttp.ClientSession() as client_session:
         await create_db(db_session)
-        db = Subscribers(db_session)
-        weather = OwmWeather.for_che(config.WEATHER_API_KEY, client_session)
-        task = MailingTask.default(db, weather)
+        writes = (
+            GroupCommit(
+                db_session,
+                config.DB_GROUP_COMMIT_DELAY,
+                config.DB_GROUP_COMMIT_BATCH,
+            )
+            if config.DB_GROUP_COMMIT_DELAY
+            else Autocommit(db_session)
+        )
+        db = Subscribers(db_session, writes)
+        dp = Dispatcher(storage=create_storage(db_session, writes))
+        locations = WeatherRegistry.default(
+            config.WEATHER_API_KEY, client_session
+        )
+        weather = locations.for_che()
+        track_weather_cache(locations)
+        await weather.origin.restore()
+        leases = Leases(
+            leases_session,
+            config.MAILING_SHARDS,
+            config.MAILING_LEASE_TTL,
+            config.MAILING_LEASE_WAIT,
+        )
+        task = MailingTask.default(db, weather, leases)
         logic = Logic(db, weather)
         logic.register(dp)
+        register_handler_metrics(dp)
 
         if config.RUN_TYPE == "polling":
-            await Polling(dp, tasks=[task]).run(bot)
+            tasks = [task, stickers.catalog()]
+            if config.METRICS_PORT:
+                # Веб-сервер aiohttp импортируется, только если он нужен
+                from app.metrics_server import MetricsServer
+
+                tasks.append(
+                    MetricsServer(config.METRICS_HOST, config.METRICS_PORT)
+                )
+            await Polling(dp, tasks=tasks).run(bot)
         elif config.RUN_TYPE == "webhook":
-            ...
+            from app.bot.webhook import Webhook
+
+            await Webhook(
+                dp,
+                tasks=[task, stickers.catalog()],
+                webhook_url=config.WEBHOOK_URL,
+                webhook_path=config.WEBHOOK_PATH,
+                webapp_host=config.WEBAPP_HOST,
+                webapp_port=config.WEBAPP_PORT,
+                workers=config.WEBHOOK_WORKERS,
+                queue_size=config.WEBHOOK_QUEUE_SIZE,
+            ).run(bot)
+
+        await stickers.catalog().flush()
+        await db.close()
@@ -1,37 +1,77 @@
 import asyncio
 import datetime as dt
 
+from app import config
 from app import mailing
-from app import utils
 from app.che import CheDatetime
-from app.times import MailingDatetimes, SleepBetween
+from app.dispatcher import MailingDispatcher
+from app.times import (
+    CatchUp,
+    MailingDatetimes,
+    SleepBefore,
+    missed_datetimes,
+    next_datetime,
+)
 
 
 class MailingTask:
     """Рассылка"""
 
-    def __init__(self, db, weather, times):
+    def __init__(
+        self, db, weather, times, dispatcher, leases=None, overlap="queue"
+    ):
         self.db = db
         self.weather = weather
         self.times = times
+        self.dispatcher = dispatcher
+        self.leases = leases
+        self.overlap = overlap
 
     @classmethod
-    def with_interval(cls, db, weather, start, delta):
-        """С переданным интервалом"""
-        return cls(db, weather, SleepBetween(MailingDatetimes(start, delta)))
+    def with_interval(cls, db, weather, start, delta, leases=None, missed=()):
+        """С переданным интервалом.
+
+        Пропущенное время рассылки `missed` догоняется, если по аренде
+        шардов видно, что рассылка в это время не завершилась
+        """
+        times = SleepBefore(
+            MailingDatetimes(start, delta), config.MAILING_LEAD
+        )
+        if leases is not None:
+            times = CatchUp(times, list(missed), leases.pending)
+        return cls(
+            db,
+            weather,
+            times,
+            MailingDispatcher.default(),
+            leases,
+            config.MAILING_OVERLAP,
+        )
 
     @classmethod
-    def default(cls, db, weather):
+    def default(cls, db, weather, leases=None):
         """Со значениями по умолчанию"""
+        now = CheDatetime.current()
+        delta = dt.timedelta(minutes=15)
         return cls.with_interval(
             db,
             weather,
-            utils.round_time_by_fifteen_minutes(CheDatetime.current()),
-            dt.timedelta(minutes=15),
+            next_datetime(now, delta),
+            delta,
+            leases,
+            missed_datetimes(now, delta, config.MAILING_GRACE),
         )
 
     def run(self, bot):
         """Добавляем задачу рассылки в основной event loop"""
         asyncio.create_task(
-            mailing.mailing(bot, self.db, self.weather, self.times)
+            mailing.mailing(
+                bot,
+                self.db,
+                self.weather,
+                self.times,
+                self.dispatcher,
+                self.leases,
+                self.overlap,
+            )
         )
@@ -1,15 +1,42 @@
-from aiohttp.web import Application, run_app
+"""Запуск бота в режиме webhook.
+
+Telegram ждёт ответа на запрос вебхука недолго и при таймауте присылает
+апдейт повторно. Поэтому апдейт сразу кладётся во внутреннюю очередь, а
+Telegram получает ответ 200, не дожидаясь хендлера.
+
+Очередь разбита на шарды по чату: апдейты одного чата попадают в один
+шард и обрабатываются по порядку, а разные чаты - параллельно. Размер
+каждого шарда ограничен; если шард переполнен, Telegram получает 503 и
+пришлёт апдейт позже
+"""
+
+import asyncio
+
+from aiogram.methods import TelegramMethod
 from aiogram.webhook.aiohttp_server import (
     SimpleRequestHandler,
     setup_application,
 )
+from aiohttp import web
+
+from app import metrics
+from app.metrics_server import setup_routes
+from app.logger import logger
 
 
 class Webhook:
     """Запуск бота в режиме webhook"""
 
     def __init__(
-        self, dp, tasks, webhook_url, webhook_path, webapp_host, webapp_port
+        self,
+        dp,
+        tasks,
+        webhook_url,
+        webhook_path,
+        webapp_host,
+        webapp_port,
+        workers,
+        queue_size,
     ):
         self.dp = dp
         self.tasks = tasks
@@ -17,15 +44,140 @@ class Webhook:
         self.webhook_path = webhook_path
         self.webapp_host = webapp_host
         self.webapp_port = webapp_port
+        self.workers = workers
+        self.queue_size = queue_size
 
-    def run(self, bot):
+    async def run(self, bot):
+        """Запускаем сервер и работаем до отмены"""
         self.dp.startup.register(on_startup(bot, self.webhook_url, self.tasks))
-        app = Application()
-        SimpleRequestHandler(dispatcher=self.dp, bot=bot).register(
+        updates = ShardedUpdates(self.dp, bot, self.workers, self.queue_size)
+        app = web.Application()
+        QueuedRequestHandler(self.dp, bot, updates).register(
             app, path=self.webhook_path
         )
+        setup_routes(app)
+        metrics.track_webhook_queue(updates)
         setup_application(app, self.dp)
-        run_app(app, host=self.webapp_host, port=self.webapp_port)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            await web.TCPSite(
+                runner, self.webapp_host, self.webapp_port
+            ).start()
+            logger.info(
+                "Вебхук слушает {}:{}", self.webapp_host, self.webapp_port
+            )
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+
+class ShardedUpdates:
+    """Очередь апдейтов, разбитая на шарды по чату.
+
+    На каждый шард - свой воркер, поэтому апдейты одного чата
+    обрабатываются строго по порядку
+    """
+
+    def __init__(self, dp, bot, workers, queue_size):
+        self.dp = dp
+        self.bot = bot
+        self.queues = [asyncio.Queue(queue_size) for _ in range(workers)]
+        self.tasks = []
+
+    def start(self):
+        """Запускаем воркеры"""
+        self.tasks = [
+            asyncio.create_task(self._worker(queue)) for queue in self.queues
+        ]
+
+    def put(self, update):
+        """Кладём апдейт в шард его чата; False, если шард переполнен"""
+        queue = self.queues[_chat_id(update) % len(self.queues)]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def size(self):
+        """Число апдейтов в очереди"""
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def close(self, timeout=10.0):
+        """Дожидаемся обработки оставшихся апдейтов и останавливаем воркеры"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self.queues)),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Не дождались обработки {} апдейтов", self.size())
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _worker(self, queue):
+        """Обработка апдейтов одного шарда по порядку"""
+        while True:
+            update = await queue.get()
+            try:
+                result = await self.dp.feed_raw_update(self.bot, update)
+                if isinstance(result, TelegramMethod):
+                    await self.dp.silent_call_request(self.bot, result)
+            except Exception:
+                logger.exception(
+                    "Не удалось обработать апдейт {}", update.get("update_id")
+                )
+            finally:
+                queue.task_done()
+
+
+def _chat_id(update):
+    """Чат апдейта, а если его нет - пользователь или номер апдейта"""
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat is not None:
+            return chat["id"]
+        if "from" in event:
+            return event["from"]["id"]
+    return update.get("update_id", 0)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука, сразу отвечающий Telegram.
+
+    Апдейт только кладётся в `ShardedUpdates`, обработка идёт в воркерах
+    """
+
+    def __init__(self, dispatcher, bot, updates):
+        super().__init__(dispatcher=dispatcher, bot=bot)
+        self.updates = updates
+
+    def register(self, app, path, **kwargs):
+        app.on_startup.append(self._handle_start)
+        super().register(app, path=path, **kwargs)
+
+    async def _handle_start(self, app):
+        self.updates.start()
+
+    async def handle(self, request):
+        update = await request.json(loads=self.bot.session.json_loads)
+        if not self.updates.put(update):
+            metrics.WEBHOOK_REJECTED.inc()
+            logger.warning(
+                "Очередь апдейтов переполнена, апдейт {} отклонён",
+                update.get("update_id"),
+            )
+            return web.json_response({}, status=503)
+        return web.json_response({})
+
+    async def close(self):
+        await self.updates.close()
+        await super().close()
 
 
 def on_startup(bot, webhook_url, tasks):
@@ -0,0 +1,148 @@
+"""Кеш ответа погодного API.
+
+Пока данные моложе мягкого TTL (`soft_ttl`), отдаём их из кеша. Когда они
+старше мягкого, но моложе жёсткого TTL (`hard_ttl`), продолжаем отдавать
+их, а в фоне запускаем обновление. Старше жёсткого TTL (или если данных
+ещё нет) - ждём обновления.
+
+Одновременно выполняется не больше одного обновления: все, кому нужны
+свежие данные, ждут одно и то же. Неудачное обновление не стирает
+предыдущие данные. Если вместо данных `fetch` отдаёт запасные
+(`Fallback`), обновление тоже считается неудачным, а запасные данные
+попадают в кеш со своим возрастом и только если они новее кешированных
+"""
+
+import asyncio
+import random
+import time
+
+from app.logger import logger
+
+
+class Fallback(Exception):
+    """Запасные данные возрастом `age` секунд вместо свежих"""
+
+    def __init__(self, value, age):
+        super().__init__(value, age)
+        self.value = value
+        self.age = age
+
+
+class CacheStats:
+    """Счётчики кеша"""
+
+    def __init__(self):
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.refresh_time = 0.0
+        self.last_refresh_time = 0.0
+
+    @property
+    def hit_ratio(self):
+        """Доля запросов, обслуженных без ожидания сети"""
+        total = self.hits + self.stale + self.misses
+        return (self.hits + self.stale) / total if total else 0.0
+
+
+class StaleWhileRevalidate:
+    """Кеш результата `fetch()` с фоновым обновлением.
+
+    Момент фонового обновления сдвигается на случайные `0..jitter` секунд,
+    чтобы несколько кешей не ходили в API одновременно. После неудачного
+    фонового обновления следующее будет не раньше, чем через `retry_delay`
+    """
+
+    def __init__(
+        self,
+        fetch,
+        soft_ttl,
+        hard_ttl,
+        jitter=0.0,
+        retry_delay=30.0,
+        clock=time.monotonic,
+    ):
+        self.fetch = fetch
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self.stats = CacheStats()
+        self.value = None
+        self.fetched_at = None
+        self.refresh_at = None
+        self.refreshing = None
+
+    async def __call__(self):
+        """Данные из кеша или, если их нет или они слишком старые, из API"""
+        now = self.clock()
+        if self.value is None or now >= self.fetched_at + self.hard_ttl:
+            self.stats.misses += 1
+            return await asyncio.shield(self._refresh())
+        if now >= self.refresh_at:
+            self.stats.stale += 1
+            self._refresh()
+        else:
+            self.stats.hits += 1
+        return self.value
+
+    def store(self, value, fetched_at):
+        """Кладём в кеш данные, полученные в момент `fetched_at`"""
+        self.value = value
+        self.fetched_at = fetched_at
+        self.refresh_at = (
+            fetched_at + self.soft_ttl + random.uniform(0, self.jitter)
+        )
+
+    def _refresh(self):
+        """Задача обновления кеша, общая для всех ожидающих"""
+        if self.refreshing is None:
+            self.refreshing = asyncio.create_task(self._fetch())
+            self.refreshing.add_done_callback(self._log_failure)
+        return self.refreshing
+
+    async def _fetch(self):
+        """Обновление кеша"""
+        start = self.clock()
+        try:
+            value = await self.fetch()
+        except Fallback as fallback:
+            return self._fall_back(fallback)
+        except Exception:
+            self.stats.failures += 1
+            self.refresh_at = self.clock() + self.retry_delay
+            raise
+        finally:
+            self.refreshing = None
+
+        now = self.clock()
+        self.store(value, now)
+        self.stats.refreshes += 1
+        self.stats.last_refresh_time = now - start
+        self.stats.refresh_time += now - start
+        return value
+
+    def _fall_back(self, fallback):
+        """Неудачное обновление с запасными данными.
+
+        Время получения запасных данных не сдвигается на текущее, поэтому
+        они устаревают как обычно
+        """
+        now = self.clock()
+        fetched_at = now - fallback.age
+        if self.value is None or fetched_at > self.fetched_at:
+            self.store(fallback.value, fetched_at)
+        self.stats.failures += 1
+        self.refresh_at = now + self.retry_delay
+        return self.value
+
+    @staticmethod
+    def _log_failure(task):
+        """Логируем неудачное обновление"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).warning(
+                "Не удалось обновить кеш погоды"
+            )
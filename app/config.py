@@ -13,3 +13,98 @@ WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 RUN_TYPE = os.getenv("RUN_TYPE", "polling")
 
 DATABASE_URL = os.getenv("DATABASE_URL", "subscribers.db")
+
+# Рассылка: число воркеров и ограничения Telegram (запросов в секунду)
+MAILING_WORKERS = int(os.getenv("MAILING_WORKERS", "16"))
+MAILING_RATE_LIMIT = float(os.getenv("MAILING_RATE_LIMIT", "30"))
+MAILING_CHAT_RATE = float(os.getenv("MAILING_CHAT_RATE", "1"))
+MAILING_CHAT_BURST = int(os.getenv("MAILING_CHAT_BURST", "4"))
+
+# Закрепление прогноза рассылки: `full` - открепить все сообщения и
+# закрепить новое, `pin` - открепить только прошлый прогноз, `replace` -
+# закрепить новый, не открепляя прошлый, `none` - не закреплять.
+# `full` и `pin` стоят одинаково: на каждого получателя по 4 запроса
+MAILING_PIN_MODE = os.getenv("MAILING_PIN_MODE", "replace")
+
+# За сколько секунд до рассылки начинать её подготовку
+MAILING_LEAD = float(os.getenv("MAILING_LEAD", "30"))
+
+# Деление рассылки между процессами бота: число шардов подписчиков, срок
+# аренды шарда в секундах и сколько секунд ждать шарды других процессов
+MAILING_SHARDS = int(os.getenv("MAILING_SHARDS", "1"))
+MAILING_LEASE_TTL = float(os.getenv("MAILING_LEASE_TTL", "60"))
+MAILING_LEASE_WAIT = float(os.getenv("MAILING_LEASE_WAIT", "180"))
+
+# Что делать, если рассылка не успела закончиться к следующей: `queue`,
+# `concurrent` или `merge` (см. `app.mailing.mailing`), и за сколько
+# секунд до запуска бота догонять пропущенные рассылки
+MAILING_OVERLAP = os.getenv("MAILING_OVERLAP", "queue")
+MAILING_GRACE = float(os.getenv("MAILING_GRACE", "3600"))
+
+# Сколько получивших прогноз подписчиков записывать в журнал доставки
+# одной пачкой
+MAILING_LEDGER_BATCH = int(os.getenv("MAILING_LEDGER_BATCH", "100"))
+
+# Групповой коммит изменений подписчиков: задержка в секундах (0 - выключен)
+# и максимальный размер пачки
+DB_GROUP_COMMIT_DELAY = float(os.getenv("DB_GROUP_COMMIT_DELAY", "0"))
+DB_GROUP_COMMIT_BATCH = int(os.getenv("DB_GROUP_COMMIT_BATCH", "100"))
+
+# Хранилище состояний FSM (`sqlite` - в БД подписчиков, общее для всех
+# процессов бота, или `memory`), через сколько секунд удалять брошенное
+# состояние и сколько секунд хранить прочитанное состояние в памяти
+# (0 - не хранить; больше нуля - только если бот запущен одним процессом)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_TTL = float(os.getenv("FSM_TTL", "86400"))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "0"))
+
+# Кеш погоды: через сколько секунд обновлять его в фоне, через сколько
+# секунд перестать отдавать устаревшие данные и случайный сдвиг обновления
+WEATHER_SOFT_TTL = float(os.getenv("WEATHER_SOFT_TTL", "300"))
+WEATHER_HARD_TTL = float(os.getenv("WEATHER_HARD_TTL", "3600"))
+WEATHER_REFRESH_JITTER = float(os.getenv("WEATHER_REFRESH_JITTER", "30"))
+
+# Снимок последнего ответа погодного API для быстрого старта.
+# Путь - шаблон с координатами места
+WEATHER_SNAPSHOT_PATH = os.getenv(
+    "WEATHER_SNAPSHOT_PATH", "weather_{lat}_{lon}.json.gz"
+)
+
+# Сетка мест погоды: размер ячейки в градусах и сколько ячеек держать в кеше
+WEATHER_CELL_SIZE = float(os.getenv("WEATHER_CELL_SIZE", "0.1"))
+WEATHER_MAX_CELLS = int(os.getenv("WEATHER_MAX_CELLS", "64"))
+
+# Вебхук: публичный адрес сервера (например, https://example.com) и путь,
+# по которому Telegram присылает апдейты, адрес и порт веб-приложения
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}" if WEBHOOK_HOST else None
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# Обработка апдейтов вебхука: число шардов очереди (по воркеру на шард)
+# и максимальное число апдейтов в шарде
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))
+
+# Адрес и порт сервера метрик в режиме polling (0 - выключен). В режиме
+# вебхука метрики отдаются приложением вебхука
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Адрес Telegram Bot API, например локального поддельного сервера
+# из `benchmarks.fake_telegram` для нагрузочного тестирования
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Стикеры: путь к файлу стикеров, файл для нераспознанных типов погоды и
+# раз в сколько секунд дописывать в него накопленные типы
+STICKERS_PATH = os.getenv("STICKERS_PATH", "stickers.json")
+UNDEFINED_WEATHER_PATH = os.getenv(
+    "UNDEFINED_WEATHER_PATH", "undefined_weather_types.txt"
+)
+STICKERS_FLUSH_INTERVAL = float(os.getenv("STICKERS_FLUSH_INTERVAL", "300"))
+
+# Логи: формат файла (`json` - по объекту JSON на строку или `text`) и
+# доля сообщений о каждом получателе рассылки, которые попадают в лог
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
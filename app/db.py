@@ -1,12 +1,16 @@
 """База данных подписчиков"""
 
+import asyncio
 import datetime as dt
 import sqlite3
+from contextlib import suppress
 from itertools import starmap
-from typing import NamedTuple
+from typing import NamedTuple, Optional
 
 import aiosqlite
 
+from app import metrics
+
 
 class UserNotFound(Exception):
     """Подписчик не найден"""
@@ -46,37 +50,196 @@ class Subscriber(NamedTuple):
 
     id: int
     mailing_time: dt.time
+    pinned_message_id: Optional[int] = None
+
+
+class Autocommit:
+    """Запись в БД с коммитом после каждого изменения"""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def execute(self, sql, parameters):
+        """Выполняем изменение и сразу коммитим"""
+        await self.session.execute(sql, parameters)
+        await self.session.commit()
+
+    async def executemany(self, sql, parameters):
+        """Выполняем изменение для каждого набора параметров и коммитим"""
+        await self.session.executemany(sql, parameters)
+        await self.session.commit()
+
+    async def close(self):
+        """Ждать нечего - всё уже закоммичено"""
+
+
+class GroupCommit:
+    """Запись в БД с групповым коммитом.
+
+    Изменения копятся и применяются одной транзакцией раз в `delay` секунд
+    либо как только их наберётся `max_batch`. Каждый вызывающий ждёт
+    коммита своей пачки, поэтому после `await` изменение уже сохранено.
+
+    Ошибка одного изменения (например, повторная регистрация) достаётся
+    только его автору, остальные изменения пачки коммитятся
+    """
+
+    def __init__(self, session, delay, max_batch):
+        self.session = session
+        self.delay = delay
+        self.max_batch = max_batch
+        self.pending = []
+        self.full = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.flusher = None
+
+    async def execute(self, sql, parameters):
+        """Добавляем изменение в пачку и ждём её коммита"""
+        await self._enqueue(self.session.execute, sql, parameters)
+
+    async def executemany(self, sql, parameters):
+        """Добавляем изменение для каждого набора параметров в пачку"""
+        await self._enqueue(self.session.executemany, sql, list(parameters))
+
+    async def _enqueue(self, method, sql, parameters):
+        """Добавляем вызов `method(sql, parameters)` в пачку"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((method, sql, parameters, future))
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self._flush_later())
+        if len(self.pending) >= self.max_batch:
+            self.full.set()
+        await future
+
+    async def close(self):
+        """Коммитим накопленные изменения.
+
+        Пачка, которую уже забрали на коммит, может ещё коммититься, когда
+        `flusher` уже сброшен, поэтому ждём и её - через блокировку
+        """
+        if self.flusher is not None:
+            self.full.set()
+            await self.flusher
+        async with self.lock:
+            pass
+
+    async def _flush_later(self):
+        """Ждём `delay` секунд или заполнения пачки и коммитим её"""
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.full.wait(), self.delay)
+        self.full.clear()
+        self.flusher = None
+        batch, self.pending = self.pending, []
+        async with self.lock:
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        """Применяем пачку изменений одной транзакцией"""
+        results = []
+        for method, sql, parameters, future in batch:
+            try:
+                await method(sql, parameters)
+                results.append((future, None))
+            except Exception as e:
+                results.append((future, e))
+
+        try:
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            results = [(future, e) for future, _ in results]
+
+        for future, error in results:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
 
 
 class Subscribers:
     """БД с подписчиками"""
 
-    def __init__(self, session):
+    def __init__(self, session, writes=None):
         self.session = session
+        self.writes = Autocommit(session) if writes is None else writes
 
+    @classmethod
+    def with_group_commit(cls, session, delay, max_batch):
+        """С групповым коммитом изменений"""
+        return cls(session, GroupCommit(session, delay, max_batch))
+
+    @metrics.DB_LATENCY.timed(method="add")
     async def add(self, user_id, mailing_time):
         """Регистрация в БД нового подписчика рассылки"""
-        await self.session.execute(
+        await self.writes.execute(
             "INSERT INTO subscribers(id, mailing_time) VALUES(?, ?)",
             (user_id, mailing_time),
         )
-        await self.session.commit()
 
+    @metrics.DB_LATENCY.timed(method="new_time")
     async def new_time(self, user_id, new_mailing_time):
         """Меняем время рассылки подписчика"""
-        await self.session.execute(
+        await self.writes.execute(
             "UPDATE subscribers SET mailing_time = ? WHERE id = ?",
             (new_mailing_time, user_id),
         )
-        await self.session.commit()
 
+    @metrics.DB_LATENCY.timed(method="delete")
     async def delete(self, user_id):
         """Удаление подписчика из БД"""
-        await self.session.execute(
+        await self.writes.execute(
             "DELETE FROM subscribers WHERE id = ?", (user_id,)
         )
-        await self.session.commit()
 
+    @metrics.DB_LATENCY.timed(method="delete_many")
+    async def delete_many(self, user_ids):
+        """Удаление подписчиков из БД одной транзакцией"""
+        await self.writes.executemany(
+            "DELETE FROM subscribers WHERE id = ?",
+            [(user_id,) for user_id in user_ids],
+        )
+
+    @metrics.DB_LATENCY.timed(method="set_pinned_many")
+    async def set_pinned_many(self, pinned):
+        """Запоминаем закреплённые у подписчиков прогнозы одной транзакцией.
+
+        `pinned` - пары (id подписчика, id закреплённого сообщения)
+        """
+        await self.writes.executemany(
+            "UPDATE subscribers SET pinned_message_id = ? WHERE id = ?",
+            [(message_id, user_id) for user_id, message_id in pinned],
+        )
+
+    @metrics.DB_LATENCY.timed(method="delivered")
+    async def delivered(self, mailing_date, mailing_time):
+        """Подписчики, уже получившие рассылку в данный день и время"""
+        async with self.session.execute(
+            "SELECT subscriber_id FROM deliveries "
+            "WHERE slot_date = ? AND slot_time = ?",
+            (mailing_date.isoformat(), mailing_time.isoformat()),
+        ) as cursor:
+            return {user_id for (user_id,) in await cursor.fetchall()}
+
+    @metrics.DB_LATENCY.timed(method="record_deliveries")
+    async def record_deliveries(self, mailing_date, mailing_time, user_ids):
+        """Отмечаем получивших рассылку одной транзакцией"""
+        slot = (mailing_date.isoformat(), mailing_time.isoformat())
+        await self.writes.executemany(
+            "INSERT OR IGNORE INTO deliveries"
+            "(slot_date, slot_time, subscriber_id) VALUES (?, ?, ?)",
+            [(*slot, user_id) for user_id in user_ids],
+        )
+
+    @metrics.DB_LATENCY.timed(method="purge_deliveries")
+    async def purge_deliveries(self, before):
+        """Удаляем журнал доставки до даты `before`"""
+        await self.writes.execute(
+            "DELETE FROM deliveries WHERE slot_date < ?", (before.isoformat(),)
+        )
+
+    @metrics.DB_LATENCY.timed(method="of_time")
     async def of_time(self, mailing_time):
         """Все подписчики с данным временем рассылки"""
         async with self.session.execute(
@@ -85,6 +248,7 @@ class Subscribers:
         ) as cursor:
             return starmap(Subscriber, await cursor.fetchall())
 
+    @metrics.DB_LATENCY.timed(method="find")
     async def find(self, user_id):
         """Возможно подписчик, а возможно и нет"""
         async with self.session.execute(
@@ -96,16 +260,109 @@ class Subscribers:
             else:
                 return Subscriber(*sub)
 
+    async def close(self):
+        """Дожидаемся записи всех изменений"""
+        await self.writes.close()
 
-async def create_db(session):
-    """Инициализируем БД"""
+
+# Миграции схемы БД. Номер версии - порядковый номер миграции, начиная с 1.
+# Уже применённые миграции нельзя менять, только добавлять новые в конец
+MIGRATIONS = (
+    """
+    CREATE TABLE IF NOT EXISTS subscribers (
+        id INTEGER NOT NULL,
+        mailing_time TIME NOT NULL,
+        PRIMARY KEY (id)
+    );
+    """,
+    # `Subscribers.of_time` выполняется каждые 15 минут. `id` - это rowid,
+    # поэтому индекс по времени рассылки покрывает запрос целиком
+    """
+    CREATE INDEX IF NOT EXISTS ix_subscribers_mailing_time
+    ON subscribers (mailing_time);
+    """,
+    # Состояния FSM для `app.storage.SqliteStorage`
+    """
+    CREATE TABLE IF NOT EXISTS fsm (
+        bot_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        destiny TEXT NOT NULL,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (bot_id, chat_id, user_id, destiny)
+    );
+    """,
+    # Аренда шардов рассылки для `app.leases.Leases`
+    """
+    CREATE TABLE IF NOT EXISTS mailing_leases (
+        slot TEXT NOT NULL,
+        shard INTEGER NOT NULL,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        done INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (slot, shard)
+    );
+    """,
+    # Последний закреплённый прогноз подписчика, чтобы откреплять только
+    # его. Индекс по времени рассылки больше не покрывает `of_time`, но
+    # всё так же отбирает строки
+    """
+    ALTER TABLE subscribers ADD COLUMN pinned_message_id INTEGER;
+    """,
+    # Журнал доставки рассылки: кто уже получил прогноз в данный слот
+    """
+    CREATE TABLE IF NOT EXISTS deliveries (
+        slot_date TEXT NOT NULL,
+        slot_time TEXT NOT NULL,
+        subscriber_id INTEGER NOT NULL,
+        PRIMARY KEY (slot_date, slot_time, subscriber_id)
+    ) WITHOUT ROWID;
+    """,
+)
+
+
+async def migrate(session, migrations=MIGRATIONS):
+    """Применяем ещё не применённые миграции по порядку.
+
+    Каждая миграция применяется в одной транзакции с записью её версии.
+    Версия перечитывается под блокировкой записи (`BEGIN IMMEDIATE`),
+    поэтому несколько одновременно запущенных процессов бота не применят
+    одну миграцию дважды
+    """
     await session.execute(
-        """
-        CREATE TABLE IF NOT EXISTS subscribers (
-            id INTEGER NOT NULL,
-            mailing_time TIME NOT NULL,
-            PRIMARY KEY (id)
-        );
-        """
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
     )
     await session.commit()
+
+    while True:
+        await session.execute("BEGIN IMMEDIATE")
+        try:
+            async with session.execute(
+                "SELECT max(version) FROM schema_version"
+            ) as cursor:
+                (version,) = await cursor.fetchone()
+            version = version or 0
+            if version >= len(migrations):
+                await session.rollback()
+                return
+            await session.execute(migrations[version])
+            await session.execute(
+                "INSERT INTO schema_version(version) VALUES (?)",
+                (version + 1,),
+            )
+        except BaseException:
+            await session.rollback()
+            raise
+        await session.commit()
+
+
+async def create_db(session):
+    """Инициализируем БД.
+
+    Журнал WAL позволяет нескольким процессам бота читать БД, пока
+    один из них пишет
+    """
+    await session.execute("PRAGMA journal_mode=WAL")
+    await migrate(session)
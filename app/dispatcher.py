@@ -0,0 +1,221 @@
+"""Диспетчер рассылки.
+
+Отправляет рассылку несколькими параллельными воркерами, соблюдая
+ограничения Telegram: около 30 сообщений в секунду на всего бота и около
+одного сообщения в секунду на чат. При получении `TelegramRetryAfter`
+все воркеры приостанавливаются на указанное сервером время
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from typing import NamedTuple, Tuple
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from app import config
+from app import metrics
+from app.logger import logger
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов.
+
+    Классический token bucket: токены пополняются со скоростью `rate`
+    в секунду, но не больше `capacity`. Каждый запрос забирает один токен
+    """
+
+    def __init__(
+        self, rate, capacity, clock=time.monotonic, sleep=asyncio.sleep
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    def steady(cls, rate, **kwargs):
+        """Без всплесков: не больше `rate` запросов за любую секунду"""
+        return cls(rate, 1, **kwargs)
+
+    async def acquire(self):
+        """Ждём, пока не появится свободный токен"""
+        async with self.lock:
+            while True:
+                now = self.clock()
+                if now < self.paused_until:
+                    await self.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await self.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Не выдаём токены ближайшие `seconds` секунд"""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = 0
+
+    def _refill(self, now):
+        """Пополнение токенов за прошедшее время"""
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+
+class ThrottledBot:
+    """Бот, соблюдающий ограничения Telegram.
+
+    Каждый запрос ждёт токен из лимита своего чата и общего лимита бота.
+    На `TelegramRetryAfter` общий лимит ставится на паузу, а запрос
+    повторяется, но не больше `max_retries` раз
+    """
+
+    def __init__(self, bot, limit, chat_limits, max_retries=5):
+        self.bot = bot
+        self.limit = limit
+        self.chat_limits = chat_limits
+        self.max_retries = max_retries
+        self.calls = 0
+        self.retries = 0
+
+    async def send_sticker(self, chat_id, sticker):
+        return await self._call(
+            chat_id, self.bot.send_sticker, chat_id, sticker
+        )
+
+    async def send_message(self, chat_id, text):
+        return await self._call(chat_id, self.bot.send_message, chat_id, text)
+
+    async def unpin_all_chat_messages(self, chat_id):
+        return await self._call(
+            chat_id, self.bot.unpin_all_chat_messages, chat_id
+        )
+
+    async def unpin_chat_message(self, chat_id, message_id):
+        return await self._call(
+            chat_id, self.bot.unpin_chat_message, chat_id, message_id
+        )
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        return await self._call(
+            chat_id,
+            self.bot.pin_chat_message,
+            chat_id,
+            message_id,
+            **kwargs,
+        )
+
+    async def _call(self, chat_id, method, *args, **kwargs):
+        """Запрос к API с ожиданием лимитов и повтором после флуд-контроля"""
+        for attempt in range(self.max_retries + 1):
+            await self.chat_limits[chat_id].acquire()
+            await self.limit.acquire()
+            self.calls += 1
+            try:
+                return await method(*args, **kwargs)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                self.limit.pause(e.retry_after)
+                logger.warning(
+                    "Флуд-контроль в чате {}, ждём {} с",
+                    chat_id,
+                    e.retry_after,
+                )
+
+
+class ChatLimits(defaultdict):
+    """Лимиты запросов по чатам, создаются при первом обращении"""
+
+    def __init__(self, rate, capacity):
+        super().__init__(lambda: TokenBucket(rate, capacity))
+
+
+class SlotReport(NamedTuple):
+    """Итоги рассылки одного слота"""
+
+    delivered: int
+    failed: int
+    blocked: Tuple[int, ...]
+    calls: int
+    retries: int
+    elapsed: float
+
+    @property
+    def rate(self):
+        """Запросов к API в секунду"""
+        return self.calls / self.elapsed if self.elapsed else 0.0
+
+
+class MailingDispatcher:
+    """Пул воркеров рассылки с общим лимитом запросов"""
+
+    def __init__(self, workers, limit, chat_rate, chat_burst):
+        self.workers = workers
+        self.limit = limit
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+
+    @classmethod
+    def from_rates(cls, workers, rate, chat_rate, chat_burst):
+        """С лимитом `rate` запросов в секунду на всего бота"""
+        return cls(workers, TokenBucket.steady(rate), chat_rate, chat_burst)
+
+    @classmethod
+    def default(cls):
+        """Со значениями из конфига"""
+        return cls.from_rates(
+            config.MAILING_WORKERS,
+            config.MAILING_RATE_LIMIT,
+            config.MAILING_CHAT_RATE,
+            config.MAILING_CHAT_BURST,
+        )
+
+    async def run(self, bot, user_ids, send):
+        """Вызываем `send(bot, user_id)` для каждого пользователя.
+
+        Воркеры разбирают пользователей из общего итератора. Ошибка
+        отправки одному пользователю не прерывает рассылку остальным.
+        Заблокировавшие бота пользователи собираются в `SlotReport.blocked`
+        """
+        throttled = ThrottledBot(
+            bot, self.limit, ChatLimits(self.chat_rate, self.chat_burst)
+        )
+        users = iter(user_ids)
+        delivered = failed = 0
+        blocked = []
+
+        async def worker():
+            nonlocal delivered, failed
+            for user_id in users:
+                try:
+                    await send(throttled, user_id)
+                    delivered += 1
+                except TelegramForbiddenError as e:
+                    metrics.MAILING_ERRORS.inc(type=type(e).__name__)
+                    blocked.append(user_id)
+                except Exception as e:
+                    metrics.MAILING_ERRORS.inc(type=type(e).__name__)
+                    failed += 1
+                    logger.exception(
+                        "Не удалось отправить рассылку пользователю {}",
+                        user_id,
+                    )
+
+        start = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        return SlotReport(
+            delivered=delivered,
+            failed=failed,
+            blocked=tuple(blocked),
+            calls=throttled.calls,
+            retries=throttled.retries,
+            elapsed=time.monotonic() - start,
+        )
@@ -72,6 +72,31 @@ class DailyForecast(BaseForecast):
         )
 
 
+class RenderedForecast:
+    """Заранее отрисованный прогноз.
+
+    Хранит готовый текст и тип погоды. Стикер по-прежнему выбирается
+    случайно при каждом запросе
+    """
+
+    def __init__(self, text, weather_type):
+        self.text = text
+        self.weather_type = weather_type
+
+    @classmethod
+    def of(cls, forecast):
+        """Отрисовываем прогноз"""
+        return cls(forecast.format(), forecast.forecast.weather_type.main)
+
+    def format(self):
+        """Готовый текст прогноза"""
+        return self.text
+
+    def sticker(self):
+        """Стикер, отражающий тип погоды"""
+        return stickers.get_by_weather(self.weather_type)
+
+
 def _format_alerts(alerts):
     """Форматирование предупреждений в прогнозе.
 
@@ -1,8 +1,16 @@
 """Клавиатуры для пользователей.
 
 Содержит все клавиатуры и их команды ('Помощь', 'О рассылке' и т.д.)
+
+Каждая клавиатура строится один раз и переиспользуется: постоянные -
+через `default`, а зависящие от времени - через `current`, одна на текущий
+час или день. Клавиатуры aiogram изменяемы, поэтому полученный экземпляр
+общий для всех и менять его нельзя: если нужна другая клавиатура,
+создаётся новый объект
 """
 
+from functools import lru_cache
+
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -45,6 +53,12 @@ class MainKeyboard(ReplyKeyboardMarkup):
             resize_keyboard=True,
         )
 
+    @classmethod
+    @lru_cache(maxsize=None)
+    def default(cls):
+        """Единственный экземпляр клавиатуры"""
+        return cls()
+
 
 class HourChoiceKeyboard(InlineKeyboardMarkup):
     """Inline-клавиатура для выбора часа рассылки"""
@@ -55,6 +69,12 @@ class HourChoiceKeyboard(InlineKeyboardMarkup):
         rows = list(chunked(buttons, 3))
         super().__init__(inline_keyboard=rows)
 
+    @classmethod
+    @lru_cache(maxsize=None)
+    def default(cls):
+        """Единственный экземпляр клавиатуры"""
+        return cls()
+
 
 class HourButton(InlineKeyboardButton):
     """Кнопка клавиатуры выбора часа"""
@@ -71,6 +91,12 @@ class MinuteChoiceKeyboard(InlineKeyboardMarkup):
         buttons = [MinuteButton(minute) for minute in minutes]
         super().__init__(inline_keyboard=[buttons])
 
+    @classmethod
+    @lru_cache(maxsize=None)
+    def default(cls):
+        """Единственный экземпляр клавиатуры"""
+        return cls()
+
 
 class MinuteButton(InlineKeyboardButton):
     """Кнопка клавиатуры выбора минуты"""
@@ -90,7 +116,13 @@ class ForecastHourChoice(InlineKeyboardMarkup):
 
     @classmethod
     def current(cls):
-        return cls(CheDatetime.current())
+        """Клавиатура от текущего часа, одна на весь час"""
+        return cls.from_hour(utils.round_time_by_hours(CheDatetime.current()))
+
+    @classmethod
+    @lru_cache(maxsize=1)
+    def from_hour(cls, hour):
+        return cls(hour)
 
 
 class ForecastHourButton(InlineKeyboardButton):
@@ -109,7 +141,13 @@ class ForecastDayChoice(InlineKeyboardMarkup):
 
     @classmethod
     def current(cls):
-        return cls(CheDatetime.current().date())
+        """Клавиатура от сегодняшнего дня, одна на весь день"""
+        return cls.from_day(CheDatetime.current().date())
+
+    @classmethod
+    @lru_cache(maxsize=1)
+    def from_day(cls, day):
+        return cls(day)
 
 
 class ForecastDayButton(InlineKeyboardButton):
@@ -0,0 +1,171 @@
+"""Аренда шардов рассылки несколькими процессами бота.
+
+Подписчики каждого слота рассылки делятся на `shards` шардов по id.
+Процесс отправляет шард, только взяв его в аренду в таблице
+`mailing_leases`; поэтому каждый подписчик получает рассылку один раз,
+сколько бы процессов ни было запущено.
+
+Пока шард отправляется, аренда продлевается. Если процесс упал, его
+аренда истекает, и шард забирает другой процесс. Отправленный шард
+помечается выполненным и больше не выдаётся
+"""
+
+import asyncio
+import os
+import random
+import socket
+import time
+from contextlib import asynccontextmanager, suppress
+
+from app.logger import logger
+
+
+def shard_of(user_id, shards):
+    """Шард подписчика, то же, что `((id % n) + n) % n` в SQL"""
+    return user_id % shards
+
+
+def slot_key(mailing_datetime):
+    """Ключ слота рассылки в таблице аренды"""
+    return mailing_datetime.strftime("%Y-%m-%d %H:%M")
+
+
+def default_owner():
+    """Имя процесса в таблице аренды"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Leases:
+    """Аренда шардов слотов рассылки.
+
+    - `shards` - на сколько шардов делятся подписчики;
+    - `ttl` - срок аренды в секундах, продлевается каждые `ttl / 3`;
+    - `wait` - сколько секунд после начала слота ждать шарды, взятые
+      другими процессами, на случай если аренда истечёт;
+    - `keep` - сколько секунд хранить записи об отправленных шардах.
+
+    Аренда коммитится сразу, поэтому ей нужно отдельное от
+    `Subscribers` соединение с БД, чтобы не закоммитить чужую пачку
+    группового коммита
+    """
+
+    def __init__(
+        self,
+        session,
+        shards,
+        ttl,
+        wait,
+        owner=None,
+        poll_interval=1.0,
+        keep=7 * 86400.0,
+        clock=time.time,
+    ):
+        self.session = session
+        self.shards = shards
+        self.ttl = ttl
+        self.wait = wait
+        self.owner = default_owner() if owner is None else owner
+        self.poll_interval = poll_interval
+        self.keep = keep
+        self.clock = clock
+
+    async def acquire(self, slot):
+        """Берём в аренду свободный шард слота.
+
+        Если свободных нет, но не все отправлены, ждём истечения чужой
+        аренды, но не дольше `wait` секунд. None - брать больше нечего
+        """
+        deadline = time.monotonic() + self.wait
+        while True:
+            for shard in random.sample(range(self.shards), self.shards):
+                if await self._claim(slot, shard):
+                    return shard
+            if await self._all_done(slot) or time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+    @asynccontextmanager
+    async def holding(self, slot, shard):
+        """Продлеваем аренду, пока шард отправляется.
+
+        После успешной отправки шард помечается выполненным. При ошибке
+        аренда просто истечёт, и шард отправит другой процесс
+        """
+        renewing = asyncio.create_task(self._renew(slot, shard))
+        try:
+            yield
+        finally:
+            renewing.cancel()
+            with suppress(asyncio.CancelledError):
+                await renewing
+        await self._done(slot, shard)
+
+    async def pending(self, mailing_datetimes):
+        """Время рассылки, в котором отправлены не все шарды"""
+        if not mailing_datetimes:
+            return []
+        async with self.session.execute(
+            "SELECT slot FROM mailing_leases WHERE slot >= ? AND done = 1 "
+            "GROUP BY slot HAVING count(*) >= ?",
+            (min(map(slot_key, mailing_datetimes)), self.shards),
+        ) as cursor:
+            done = {slot for (slot,) in await cursor.fetchall()}
+        return [
+            mailing_datetime
+            for mailing_datetime in mailing_datetimes
+            if slot_key(mailing_datetime) not in done
+        ]
+
+    async def purge(self):
+        """Удаляем старые записи аренды"""
+        await self.session.execute(
+            "DELETE FROM mailing_leases WHERE expires_at < ?",
+            (self.clock() - self.keep,),
+        )
+        await self.session.commit()
+
+    async def _claim(self, slot, shard):
+        """Берём шард, если он свободен или чужая аренда истекла"""
+        now = self.clock()
+        async with self.session.execute(
+            "INSERT INTO mailing_leases(slot, shard, owner, expires_at) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(slot, shard) DO UPDATE SET "
+            "owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE done = 0 AND expires_at <= ?",
+            (slot, shard, self.owner, now + self.ttl, now),
+        ) as cursor:
+            claimed = cursor.rowcount == 1
+        await self.session.commit()
+        if claimed:
+            logger.info("Взят шард {} рассылки {}", shard, slot)
+        return claimed
+
+    async def _renew(self, slot, shard):
+        """Продлеваем аренду каждые `ttl / 3` секунд"""
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self.session.execute(
+                "UPDATE mailing_leases SET expires_at = ? "
+                "WHERE slot = ? AND shard = ? AND owner = ?",
+                (self.clock() + self.ttl, slot, shard, self.owner),
+            )
+            await self.session.commit()
+
+    async def _done(self, slot, shard):
+        """Помечаем шард отправленным"""
+        await self.session.execute(
+            "UPDATE mailing_leases SET done = 1, expires_at = ? "
+            "WHERE slot = ? AND shard = ? AND owner = ?",
+            (self.clock(), slot, shard, self.owner),
+        )
+        await self.session.commit()
+
+    async def _all_done(self, slot):
+        """Отправлены ли все шарды слота"""
+        async with self.session.execute(
+            "SELECT count(*) FROM mailing_leases WHERE slot = ? AND done = 1",
+            (slot,),
+        ) as cursor:
+            (done,) = await cursor.fetchone()
+        return done == self.shards
@@ -0,0 +1,106 @@
+"""Погода для нескольких мест.
+
+Координаты округляются до ячеек сетки, и на каждую ячейку заводится одна
+погода со своим кешем. Поэтому запросы к OpenWeatherMap растут с числом
+разных мест, а не с числом пользователей: все, кто в одной ячейке,
+получают данные из одного кеша, а одновременные обновления одной ячейки
+сливаются в одно
+"""
+
+from collections import OrderedDict
+from typing import NamedTuple
+
+from app import config
+from app.weather import OwmWeather, RenderedWeather
+
+
+# Координаты Череповца
+CHE = (59.09, 37.91)
+
+
+class GridCell(NamedTuple):
+    """Ячейка сетки координат"""
+
+    row: int
+    col: int
+    size: float
+
+    @classmethod
+    def snap(cls, lat, lon, size):
+        """Ячейка, в которую попадают координаты"""
+        return cls(round(lat / size), round(lon / size), size)
+
+    @property
+    def lat(self):
+        """Широта центра ячейки"""
+        return round(self.row * self.size, 6)
+
+    @property
+    def lon(self):
+        """Долгота центра ячейки"""
+        return round(self.col * self.size, 6)
+
+
+class WeatherRegistry:
+    """Реестр погоды по ячейкам сетки.
+
+    Хранит не больше `max_cells` ячеек. Когда их становится больше,
+    вытесняется та, к которой дольше всех не обращались. Закреплённые
+    ячейки (Череповец, на который идёт рассылка) не вытесняются: на их
+    погоду держат ссылку рассылка и обработчики, и новая погода для той же
+    ячейки завела бы второй кеш
+    """
+
+    def __init__(self, api_key, session, cell_size, max_cells):
+        self.api_key = api_key
+        self.session = session
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.cells = OrderedDict()
+        self.pinned = set()
+
+    @classmethod
+    def default(cls, api_key, session):
+        """Со значениями из конфига"""
+        return cls(
+            api_key,
+            session,
+            config.WEATHER_CELL_SIZE,
+            config.WEATHER_MAX_CELLS,
+        )
+
+    def for_geo(self, lat, lon):
+        """Погода для места по координатам"""
+        cell = GridCell.snap(lat, lon, self.cell_size)
+        weather = self.cells.get(cell)
+        if weather is None:
+            weather = self.cells[cell] = RenderedWeather(
+                OwmWeather.from_geo(
+                    cell.lat, cell.lon, self.api_key, self.session
+                )
+            )
+            if len(self.cells) > self.max_cells:
+                self._evict()
+        else:
+            self.cells.move_to_end(cell)
+        return weather
+
+    def pin(self, lat, lon):
+        """Погода для места, ячейка которого никогда не вытесняется"""
+        self.pinned.add(GridCell.snap(lat, lon, self.cell_size))
+        return self.for_geo(lat, lon)
+
+    def _evict(self):
+        for cell in self.cells:
+            if cell not in self.pinned:
+                del self.cells[cell]
+                return
+
+    def cache_stats(self):
+        """Счётчики кеша погоды каждой ячейки"""
+        for cell, weather in self.cells.items():
+            yield cell, weather.origin.api.stats
+
+    def for_che(self):
+        """Погода для Череповца"""
+        return self.pin(*CHE)
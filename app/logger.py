@@ -1,16 +1,53 @@
 """Логгер.
 
-Все сообщения выводятся в консоль и папку logs
+Все сообщения выводятся в консоль и папку logs.
+
+Сообщения пишутся не в цикле событий, а в фоновом потоке loguru
+(`enqueue=True`): вызов логгера только кладёт запись в очередь. В том же
+потоке файл логов пишется построчно и сжимается при ротации, так что
+при остановке бота в файле остаются все записанные сообщения.
+Частые сообщения о каждом получателе рассылки (`sampled_logger`) могут
+попадать в лог лишь в доле `LOG_SAMPLE_RATE`
 """
 
+import random
+import sys
+
 from loguru import logger
 
+from app import config
+
+
+def sample(record):
+    """Отбрасываем частое сообщение с вероятностью `1 - LOG_SAMPLE_RATE`.
+
+    Решение принимается один раз для всех обработчиков
+    """
+    record["extra"]["dropped"] = random.random() >= config.LOG_SAMPLE_RATE
+
 
+def not_dropped(record):
+    """Пропускаем все сообщения, кроме отброшенных `sample`"""
+    return not record["extra"].get("dropped")
+
+
+logger.remove()
+logger.add(
+    sys.stderr,
+    filter=not_dropped,
+    enqueue=True,
+)
 logger.add(
     encoding="u8",
     sink="logs/log.log",
     format="{time:DD-MM-YYYY at HH:mm:ss} | {level} | {message}",
+    filter=not_dropped,
+    serialize=config.LOG_FORMAT == "json",
+    enqueue=True,
     rotation="1 week",
     compression="zip",
     backtrace=False,
 )
+
+# Логгер частых сообщений о каждом пользователе во время рассылки
+sampled_logger = logger.patch(sample)
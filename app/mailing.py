@@ -1,47 +1,406 @@
 """Модуль рассылки погоды.
 
-Каждые 15 минут происходит рассылка всем её подписчикам
+Каждые 15 минут происходит рассылка всем её подписчикам.
+
+Рассылка устроена как конвейер из двух стадий: первая заранее, до
+наступления времени рассылки, прогревает кеш погоды, достаёт подписчиков
+и готовит текст со стикером, а вторая в нужный момент только отправляет.
+
+Получившие прогноз подписчики пачками записываются в журнал доставки,
+поэтому повторная отправка слота после перезапуска бота или при
+догоняющей рассылке уходит только тем, кто прогноз ещё не получил
 """
 
-from aiogram.exceptions import TelegramForbiddenError
+import asyncio
+import datetime as dt
+from contextlib import suppress
+from typing import Dict, List, NamedTuple, Optional
+
+from aiogram.exceptions import TelegramBadRequest
 
+from app import config
+from app import metrics
 from app import templates
-from app.logger import logger
+from app.che import CheDatetime
+from app.leases import shard_of, slot_key
+from app.logger import logger, sampled_logger
+from app.times import CLOCK
+
+
+# Что делать с рассылкой, время которой наступило до окончания предыдущей
+OVERLAP_POLICIES = ("queue", "concurrent", "merge")
+
+# Как закреплять прогноз рассылки, см. `send_mailing`
+PIN_MODES = ("full", "pin", "replace", "none")
+
+# Сколько дней хранить журнал доставки
+LEDGER_DAYS = 2
+
+
+class PreparedMailing(NamedTuple):
+    """Подготовленная к отправке рассылка"""
 
+    mailing_time: dt.time
+    message_text: str
+    sticker: str
+    subscribers: List[int]
+    pinned: Dict[int, int] = {}
+    mailing_date: Optional[dt.date] = None
 
-async def mailing(bot, db, weather, mailing_times):
+
+async def mailing(
+    bot,
+    db,
+    weather,
+    mailing_times,
+    dispatcher,
+    leases=None,
+    overlap="queue",
+    clock=CLOCK,
+):
     """Рассылка.
 
     Каждые 15 минут происходит запрос к БД на наличие подписчиков с
-    данным временем, и каждому отправляет прогноз погоды
+    данным временем, и каждому отправляет прогноз погоды.
+
+    Время рассылки из `mailing_times` может приходить раньше его
+    наступления - это время уходит на подготовку рассылки.
+
+    С арендой шардов `leases` рассылка делится между процессами бота.
+
+    Если рассылка не успела закончиться к следующей, `overlap` решает,
+    что делать со следующей:
+
+    - `queue` - начать сразу после окончания текущей;
+    - `concurrent` - начать вовремя, параллельно с текущей;
+    - `merge` - после окончания текущей отправить уже подготовленные
+      наступившие рассылки одной волной через общий лимит диспетчера.
+
+    Когда время рассылки кончается, рассылка завершается; ошибка потока
+    времени рассылки выбрасывается дальше
     """
-    async for mailing_time in mailing_times:
-        await send_mailings(bot, db, weather, mailing_time.time())
+    if overlap not in OVERLAP_POLICIES:
+        raise ValueError(f"Неизвестная политика наложения: {overlap}")
 
+    slots = asyncio.Queue(maxsize=1)
+    prefetching = asyncio.create_task(
+        prefetch(db, weather, mailing_times, slots)
+    )
+    running = set()
+    postponed = None
+    try:
+        while True:
+            slot = postponed or await next_slot(slots, prefetching)
+            if slot is None:
+                break
+            wave = [slot]
+            postponed = None
+            await clock.sleep_until(wave[0][0])
+            while overlap == "merge" and not slots.empty():
+                slot = slots.get_nowait()
+                if clock.until(slot[0]) > 0:
+                    postponed = slot
+                    break
+                wave.append(slot)
+            sending = asyncio.gather(
+                *(
+                    send_slot(
+                        bot,
+                        db,
+                        weather,
+                        dispatcher,
+                        leases,
+                        clock,
+                        mailing_datetime,
+                        prepared,
+                    )
+                    for mailing_datetime, prepared in wave
+                )
+            )
+            if overlap == "concurrent":
+                running.add(sending)
+                sending.add_done_callback(running.discard)
+            else:
+                await sending
+        await asyncio.gather(*running)
+    finally:
+        prefetching.cancel()
+        for sending in running:
+            sending.cancel()
 
-async def send_mailings(bot, db, weather, mailing_time):
-    """Отправляем рассылку пользователям с данным временем"""
+
+async def next_slot(slots, prefetching):
+    """Следующая подготовленная рассылка.
+
+    Если подготовка закончилась, None, а если упала - её ошибка
+    """
+    if not slots.empty():
+        return slots.get_nowait()
+    getting = asyncio.ensure_future(slots.get())
+    try:
+        await asyncio.wait(
+            {getting, prefetching}, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        getting.cancel()
+    if getting.done() and not getting.cancelled():
+        return getting.result()
+    prefetching.result()
+    return None
+
+
+async def send_slot(
+    bot, db, weather, dispatcher, leases, clock, mailing_datetime, prepared
+):
+    """Отправляем рассылку, наступившую в `mailing_datetime`.
+
+    Ошибка рассылки логируется и не останавливает следующие
+    """
+    try:
+        if prepared is None:
+            prepared = await prepare_mailing(
+                db, weather, mailing_datetime.time(), mailing_datetime.date()
+            )
+        metrics.MAILING_LATENESS.observe(clock.lateness(mailing_datetime))
+        if leases is None:
+            await send_prepared(bot, db, prepared, dispatcher)
+        else:
+            await send_sharded(
+                bot, db, prepared, dispatcher, leases, mailing_datetime
+            )
+    except Exception:
+        logger.exception("Не удалась рассылка {}", mailing_datetime)
+
+
+async def prefetch(db, weather, mailing_times, slots):
+    """Стадия подготовки рассылки.
+
+    Если подготовить заранее не удалось, отдаём время рассылки
+    без подготовки - она повторится в момент отправки
+    """
+    try:
+        async for mailing_datetime in mailing_times:
+            try:
+                prepared = await prepare_mailing(
+                    db,
+                    weather,
+                    mailing_datetime.time(),
+                    mailing_datetime.date(),
+                )
+            except Exception:
+                prepared = None
+                logger.exception("Не удалось заранее подготовить рассылку")
+            await slots.put((mailing_datetime, prepared))
+    except Exception:
+        logger.exception("Остановился поток времени рассылки")
+        raise
+
+
+async def prepare_mailing(db, weather, mailing_time, mailing_date=None):
+    """Готовим рассылку: прогноз, текст сообщения, стикер и подписчиков.
+
+    По умолчанию рассылка на сегодня
+    """
+    if mailing_date is None:
+        mailing_date = CheDatetime.current().date()
     forecast = await weather.current()
-    message_text = templates.MAILING_MESSAGE.format(forecast.format())
-    sticker = forecast.sticker()
-    subscribers = await db.of_time(mailing_time)
-    for subscriber in subscribers:
-        user_id = subscriber.id
-        try:
-            await send_mailing(bot, user_id, message_text, sticker)
-            logger.info(f"Пользователь {user_id} получил ежедневный прогноз")
-        except TelegramForbiddenError:
-            await db.delete(user_id)
-            logger.info(
-                f"Пользователь {user_id} удалён из рассылки из-за блока бота"
+    subscribers = list(await db.of_time(mailing_time))
+    return PreparedMailing(
+        mailing_time=mailing_time,
+        mailing_date=mailing_date,
+        message_text=templates.MAILING_MESSAGE.format(forecast.format()),
+        sticker=forecast.sticker(),
+        subscribers=[subscriber.id for subscriber in subscribers],
+        pinned={
+            subscriber.id: subscriber.pinned_message_id
+            for subscriber in subscribers
+            if subscriber.pinned_message_id is not None
+        },
+    )
+
+
+async def send_mailings(bot, db, weather, mailing_time, dispatcher):
+    """Отправляем рассылку пользователям с данным временем"""
+    prepared = await prepare_mailing(db, weather, mailing_time)
+    await send_prepared(bot, db, prepared, dispatcher)
+
+
+async def send_prepared(
+    bot,
+    db,
+    prepared,
+    dispatcher,
+    pin_mode=config.MAILING_PIN_MODE,
+    batch=config.MAILING_LEDGER_BATCH,
+):
+    """Отправляем подготовленную рассылку.
+
+    Отправляем только тем, кого нет в журнале доставки слота. Получившие
+    прогноз записываются в журнал пачками по `batch` подписчиков: после
+    падения бота повторно прогноз могут получить не больше `batch`
+    подписчиков. Закреплённые прогнозы запоминаются одной транзакцией
+    после отправки
+    """
+    if pin_mode not in PIN_MODES:
+        raise ValueError(f"Неизвестный режим закрепления: {pin_mode}")
+    mailing_date = prepared.mailing_date or CheDatetime.current().date()
+    served = await db.delivered(mailing_date, prepared.mailing_time)
+    subscribers = [
+        user_id for user_id in prepared.subscribers if user_id not in served
+    ]
+    if len(subscribers) < len(prepared.subscribers):
+        logger.info(
+            "Рассылка {:%H:%M}: {} подписчиков уже получили прогноз",
+            prepared.mailing_time,
+            len(prepared.subscribers) - len(subscribers),
+        )
+    delivered = []
+    pinned = {}
+
+    async def record():
+        batch = delivered[:]
+        delivered.clear()
+        await db.record_deliveries(mailing_date, prepared.mailing_time, batch)
+
+    async def send(bot, user_id):
+        message_id = await send_mailing(
+            bot,
+            user_id,
+            prepared.message_text,
+            prepared.sticker,
+            prepared.pinned.get(user_id),
+            pin_mode,
+        )
+        if message_id is not None:
+            pinned[user_id] = message_id
+        delivered.append(user_id)
+        sampled_logger.info(
+            "Пользователь {} получил ежедневный прогноз", user_id
+        )
+        if len(delivered) >= batch:
+            await record()
+
+    report = await dispatcher.run(bot, subscribers, send)
+    if delivered:
+        await record()
+    await db.purge_deliveries(mailing_date - dt.timedelta(days=LEDGER_DAYS))
+    if pinned:
+        await db.set_pinned_many(pinned.items())
+    metrics.MAILING_SLOT_DURATION.observe(report.elapsed)
+    metrics.MAILING_RECIPIENTS.inc(report.delivered, outcome="delivered")
+    metrics.MAILING_RECIPIENTS.inc(len(report.blocked), outcome="blocked")
+    metrics.MAILING_RECIPIENTS.inc(report.failed, outcome="failed")
+    await prune_blocked(db, report.blocked)
+    logger.info(
+        "Рассылка {:%H:%M}: {} отправлено, {} заблокировали бота, "
+        "{} ошибок, {} запросов за {:.2f} с ({:.1f} запросов/с), {} повторов",
+        prepared.mailing_time,
+        report.delivered,
+        len(report.blocked),
+        report.failed,
+        report.calls,
+        report.elapsed,
+        report.rate,
+        report.retries,
+    )
+
+
+async def send_sharded(
+    bot, db, prepared, dispatcher, leases, mailing_datetime
+):
+    """Отправляем подготовленную рассылку по взятым в аренду шардам.
+
+    Берём шарды, пока они не кончатся: так рассылку слота делят все
+    живые процессы бота, а шарды упавшего процесса достаются остальным
+    """
+    slot = slot_key(mailing_datetime)
+    while True:
+        shard = await leases.acquire(slot)
+        if shard is None:
+            break
+        async with leases.holding(slot, shard):
+            await send_prepared(
+                bot,
+                db,
+                prepared._replace(
+                    subscribers=[
+                        user_id
+                        for user_id in prepared.subscribers
+                        if shard_of(user_id, leases.shards) == shard
+                    ]
+                ),
+                dispatcher,
             )
+    await leases.purge()
 
 
-async def send_mailing(bot, user_id, message_text, sticker):
-    """Отправляем рассылку пользователю"""
+async def prune_blocked(db, user_ids):
+    """Удаляем из рассылки заблокировавших бота пользователей.
+
+    Удаление одной транзакцией после отправки, чтобы не задерживать
+    рассылку остальным подписчикам
+    """
+    if not user_ids:
+        return
+    await db.delete_many(user_ids)
+    logger.info(
+        "Из рассылки удалено {} пользователей из-за блока бота", len(user_ids)
+    )
+
+
+async def send_mailing(
+    bot,
+    user_id,
+    message_text,
+    sticker,
+    pinned_message_id=None,
+    pin_mode="full",
+):
+    """Отправляем рассылку пользователю.
+
+    Возвращаем id закреплённого прогноза или None, если ничего не
+    закрепляли. Режимы закрепления `pin_mode`:
+
+    - `full` - открепляем все сообщения и закрепляем новый прогноз;
+    - `pin` - открепляем только прошлый прогноз `pinned_message_id`
+      (все сообщения - если он неизвестен) и закрепляем новый. Запросов
+      столько же, сколько в `full`, зато другие закрепы остаются;
+    - `replace` - закрепляем новый прогноз, не открепляя прошлый, на
+      запрос меньше;
+    - `none` - не закрепляем, вдвое меньше запросов к API
+    """
     await bot.send_sticker(user_id, sticker)
     message = await bot.send_message(user_id, message_text)
-    await unpin_all_and_pin_message(bot, message)
+    if pin_mode == "none":
+        return None
+    if pin_mode == "full":
+        await unpin_all_and_pin_message(bot, message)
+        return message.message_id
+    if pin_mode == "pin":
+        await unpin_previous(bot, message.chat.id, pinned_message_id)
+    await pin_message(bot, message)
+    return message.message_id
+
+
+async def unpin_previous(bot, chat_id, pinned_message_id):
+    """Открепляем прошлый прогноз.
+
+    Если он уже откреплён пользователем или удалён, ничего не делаем
+    """
+    if pinned_message_id is None:
+        await bot.unpin_all_chat_messages(chat_id)
+        return
+    with suppress(TelegramBadRequest):
+        await bot.unpin_chat_message(chat_id, pinned_message_id)
+
+
+async def pin_message(bot, message):
+    """Закрепляем прогноз без уведомления"""
+    await bot.pin_chat_message(
+        chat_id=message.chat.id,
+        message_id=message.message_id,
+        disable_notification=True,
+    )
 
 
 async def unpin_all_and_pin_message(bot, message):
@@ -0,0 +1,319 @@
+"""Метрики бота.
+
+Счётчики и гистограммы хранятся в памяти процесса и отдаются в текстовом
+формате Prometheus по адресу `/metrics` - на приложении вебхука или, в
+режиме polling, на отдельном порту (`METRICS_PORT`), см.
+`app.metrics_server`
+"""
+
+import bisect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Границы корзин гистограмм задержек в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Границы корзин длительности рассылки в секундах
+SLOT_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 900.0)
+
+
+def _escape(value):
+    """Значение метки с экранированием"""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _format_labels(names, values, extra=()):
+    """Метки в формате `{name="value",...}`"""
+    pairs = [*((name, values[i]) for i, name in enumerate(names)), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _format_value(value):
+    """Значение в формате Prometheus"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """Метрика с именем, описанием и метками"""
+
+    type = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels):
+        """Значения меток в порядке их объявления"""
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def samples(self):
+        """Значения метрики: (суффикс имени, значения меток, доп. метки,
+        значение)"""
+        return ()
+
+    def render(self):
+        """Метрика в текстовом формате Prometheus"""
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        for suffix, key, extra, value in self.samples():
+            labels = _format_labels(self.labels, key, extra)
+            yield f"{self.name}{suffix}{labels} {_format_value(value)}"
+
+
+class Counter(Metric):
+    """Возрастающий счётчик"""
+
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        """Увеличиваем счётчик"""
+        self.values[self._key(labels)] += amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield "", key, (), value
+
+
+class Gauge(Metric):
+    """Текущее значение, вычисляемое при каждом запросе метрик.
+
+    `collect()` возвращает словарь {значения меток: значение}
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), collect=dict):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def samples(self):
+        for key, value in self.collect().items():
+            yield "", key, (), value
+
+
+class CollectedCounter(Gauge):
+    """Счётчик, значение которого хранится вне реестра"""
+
+    type = "counter"
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам"""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.counts = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self.sums = defaultdict(float)
+
+    def observe(self, value, **labels):
+        """Учитываем значение"""
+        key = self._key(labels)
+        self.counts[key][bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Учитываем время выполнения блока кода"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """Декоратор, учитывающий время выполнения корутины"""
+
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def samples(self):
+        for key, counts in self.counts.items():
+            bounds = (*self.buckets, float("inf"))
+            total = 0
+            for i, count in enumerate(counts):
+                total += count
+                bound = bounds[i]
+                yield "_bucket", key, (("le", _format_value(bound)),), total
+            yield "_sum", key, (), self.sums[key]
+            yield "_count", key, (), total
+
+
+class Registry:
+    """Все метрики процесса"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        """Добавляем метрику"""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.register(
+    Histogram(
+        "bot_handler_seconds",
+        "Время обработки апдейта хендлером",
+        labels=("route",),
+    )
+)
+OWM_LATENCY = REGISTRY.register(
+    Histogram("owm_fetch_seconds", "Время запроса к OpenWeatherMap")
+)
+DB_LATENCY = REGISTRY.register(
+    Histogram(
+        "db_query_seconds",
+        "Время запроса к БД подписчиков",
+        labels=("method",),
+    )
+)
+MAILING_SLOT_DURATION = REGISTRY.register(
+    Histogram(
+        "mailing_slot_seconds",
+        "Время рассылки одного слота",
+        buckets=SLOT_BUCKETS,
+    )
+)
+MAILING_LATENESS = REGISTRY.register(
+    Histogram(
+        "mailing_lateness_seconds",
+        "Опоздание начала рассылки относительно её времени",
+        buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0),
+    )
+)
+MAILING_RECIPIENTS = REGISTRY.register(
+    Counter(
+        "mailing_recipients_total",
+        "Получатели рассылки по исходу отправки",
+        labels=("outcome",),
+    )
+)
+MAILING_ERRORS = REGISTRY.register(
+    Counter(
+        "mailing_errors_total",
+        "Ошибки отправки рассылки по типу",
+        labels=("type",),
+    )
+)
+
+WEBHOOK_REJECTED = REGISTRY.register(
+    Counter(
+        "webhook_rejected_total",
+        "Апдейты, отклонённые из-за переполненной очереди",
+    )
+)
+
+
+def track_webhook_queue(updates):
+    """Метрика размера очереди апдейтов вебхука"""
+    REGISTRY.register(
+        Gauge(
+            "webhook_queue_size",
+            "Апдейты в очереди на обработку",
+            collect=lambda: {(): updates.size()},
+        )
+    )
+
+
+def track_weather_cache(locations):
+    """Метрики кешей погоды из реестра мест `locations`"""
+
+    def stats():
+        return {
+            (cell.lat, cell.lon): cache
+            for cell, cache in locations.cache_stats()
+        }
+
+    def collected(kind, name, help, value):
+        REGISTRY.register(
+            kind(
+                name,
+                help,
+                labels=("lat", "lon"),
+                collect=lambda: {
+                    key: value(cache) for key, cache in stats().items()
+                },
+            )
+        )
+
+    collected(
+        Gauge,
+        "weather_cache_hit_ratio",
+        "Доля запросов погоды, обслуженных из кеша",
+        lambda cache: cache.hit_ratio,
+    )
+    collected(
+        CollectedCounter,
+        "weather_cache_misses_total",
+        "Запросы погоды, ждавшие обновления кеша",
+        lambda cache: cache.misses,
+    )
+    collected(
+        CollectedCounter,
+        "weather_cache_failures_total",
+        "Неудачные обновления кеша погоды",
+        lambda cache: cache.failures,
+    )
+
+
+class HandlerMetrics:
+    """Inner middleware, учитывающий время работы хендлеров.
+
+    Маршрут - имя класса хендлера из `app.bot.handlers`
+    """
+
+    async def __call__(self, handler, event, data):
+        with HANDLER_LATENCY.time(route=_route_name(data.get("handler"))):
+            return await handler(event, data)
+
+
+def _route_name(handler):
+    """Имя класса хендлера или функции, если хендлер - не метод"""
+    callback = getattr(handler, "callback", None)
+    owner = getattr(callback, "__self__", None)
+    if owner is not None:
+        return type(owner).__name__
+    return getattr(callback, "__name__", "unknown")
+
+
+def register_handler_metrics(dp):
+    """Учитываем время работы хендлеров сообщений и колбеков"""
+    middleware = HandlerMetrics()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
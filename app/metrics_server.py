@@ -0,0 +1,46 @@
+"""Сервер метрик.
+
+Отдаёт метрики из `app.metrics` в текстовом формате Prometheus. Вынесен
+из `app.metrics`, чтобы модули, которые только пишут метрики, не
+импортировали веб-сервер aiohttp
+"""
+
+import asyncio
+
+from aiohttp import web
+
+from app.logger import logger
+from app.metrics import REGISTRY
+
+
+async def handle_metrics(request):
+    """Отдаём метрики"""
+    return web.Response(
+        text=REGISTRY.render(), content_type="text/plain", charset="utf-8"
+    )
+
+
+def setup_routes(app, path="/metrics"):
+    """Добавляем адрес метрик в aiohttp-приложение"""
+    app.router.add_get(path, handle_metrics)
+
+
+class MetricsServer:
+    """Отдельный сервер метрик для режима polling"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def run(self, bot):
+        """Добавляем запуск сервера в основной event loop"""
+        asyncio.create_task(self.serve())
+
+    async def serve(self):
+        """Запуск сервера"""
+        app = web.Application()
+        setup_routes(app)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        logger.info("Метрики доступны на {}:{}", self.host, self.port)
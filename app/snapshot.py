@@ -0,0 +1,64 @@
+"""Снимок последнего ответа погодного API на диске.
+
+Ответ хранится в сжатом JSON вместе со временем получения. Снимок
+загружается при запуске, чтобы не ждать API после перезапуска, и служит
+запасным вариантом, когда API недоступно
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import time
+from typing import NamedTuple
+
+from app.logger import logger
+
+
+class Saved(NamedTuple):
+    """Сохранённый ответ API"""
+
+    data: dict
+    fetched_at: float
+
+    @property
+    def age(self):
+        """Возраст ответа в секундах"""
+        return max(0.0, time.time() - self.fetched_at)
+
+
+class Snapshot:
+    """Снимок ответа API в файле `path`.
+
+    Чтение и запись выполняются в отдельном потоке, чтобы не блокировать
+    event loop. Запись атомарна: сначала во временный файл, затем замена
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    async def save(self, data, fetched_at=None):
+        """Сохраняем ответ API"""
+        saved = Saved(data, time.time() if fetched_at is None else fetched_at)
+        await asyncio.to_thread(self._write, saved)
+
+    async def load(self):
+        """Последний сохранённый ответ или None, если его нет"""
+        try:
+            return await asyncio.to_thread(self._read)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            logger.exception("Не удалось прочитать снимок погоды")
+            return None
+
+    def _write(self, saved):
+        tmp = f"{self.path}.tmp"
+        with gzip.open(tmp, "wt", encoding="u8") as f:
+            json.dump(saved._asdict(), f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _read(self):
+        with gzip.open(self.path, "rt", encoding="u8") as f:
+            saved = json.load(f)
+        return Saved(saved["data"], saved["fetched_at"])
@@ -1,36 +1,120 @@
 """Стикеры, прикрепляемые к прогнозам погоды.
 
-Все стикеры, разбитые по типу погоды, находятся в файле stickers.json.
-Также там находятся стикеры нераспознанной погоды (_UNDEFINED_WEATHER_STICKERS)
-и стикер для случая, когда возникла непредвиденная ошибка (MAINTAINCE_STICKER)
+Все стикеры, разбитые по типу погоды, находятся в файле `STICKERS_PATH`
+(по умолчанию stickers.json). Также там находятся стикеры нераспознанной
+погоды и стикер для случая, когда возникла непредвиденная ошибка.
+
+Файл читается один раз при первом обращении к каталогу. Нераспознанные
+типы погоды считаются в памяти, а накопленные счётчики периодически
+дописываются в файл в отдельном потоке, не блокируя event loop
 """
 
+import asyncio
 import json
+from collections import Counter
+from functools import lru_cache
 from random import choice
+from types import MappingProxyType
+from typing import Mapping, Tuple
 
+from app import config
+from app.logger import logger
 
-def _load_stickers():
-    """Загрузка стикеров из stickers.json"""
-    with open("stickers.json", encoding="u8") as f:
-        return json.load(f)
 
+class StickerCatalog:
+    """Каталог стикеров.
 
-_STICKERS = _load_stickers()
+    - `weather_types` - стикеры по типу погоды;
+    - `undefined_stickers` - стикеры нераспознанной погоды;
+    - `maintaince_sticker` - стикер непредвиденной ошибки;
+    - `undefined_path` - файл, куда дописываются нераспознанные типы
+      погоды с числом их появлений
+    """
 
-MAINTAINCE_STICKER = _STICKERS["maintainceSticker"]
-_UNDEFINED_WEATHER_STICKERS = _STICKERS["undefinedWeatherStickers"]
-_WEATHER_TYPES = _STICKERS["weatherTypes"]
+    def __init__(
+        self,
+        weather_types: Mapping[str, Tuple[str, ...]],
+        undefined_stickers: Tuple[str, ...],
+        maintaince_sticker: str,
+        undefined_path="undefined_weather_types.txt",
+    ):
+        self.weather_types = weather_types
+        self.undefined_stickers = undefined_stickers
+        self.maintaince_sticker = maintaince_sticker
+        self.undefined_path = undefined_path
+        self.undefined = Counter()
 
+    @classmethod
+    def from_file(cls, path, undefined_path="undefined_weather_types.txt"):
+        """Каталог из JSON-файла стикеров"""
+        with open(path, encoding="u8") as f:
+            stickers = json.load(f)
+        return cls(
+            weather_types=MappingProxyType(
+                {
+                    weather_type: tuple(options)
+                    for weather_type, options in stickers[
+                        "weatherTypes"
+                    ].items()
+                }
+            ),
+            undefined_stickers=tuple(stickers["undefinedWeatherStickers"]),
+            maintaince_sticker=stickers["maintainceSticker"],
+            undefined_path=undefined_path,
+        )
 
-def get_by_weather(weather_type):
-    """Случайный стикер по типу погоды, либо стикер нераспознанной погоды"""
-    if weather_type not in _WEATHER_TYPES:
-        _log_undefined_weather_type(weather_type)
-        return choice(_UNDEFINED_WEATHER_STICKERS)
-    return choice(_WEATHER_TYPES[weather_type])
+    def by_weather(self, weather_type):
+        """Случайный стикер по типу погоды, либо стикер нераспознанной
+        погоды
+        """
+        options = self.weather_types.get(weather_type)
+        if options is None:
+            self.undefined[weather_type] += 1
+            return choice(self.undefined_stickers)
+        return choice(options)
+
+    def run(self, bot):
+        """Добавляем запись нераспознанных типов в основной event loop"""
+        asyncio.create_task(self.flush_every(config.STICKERS_FLUSH_INTERVAL))
+
+    async def flush_every(self, interval):
+        """Записываем нераспознанные типы раз в `interval` секунд"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except OSError:
+                logger.exception("Не удалось записать типы погоды")
+
+    async def flush(self):
+        """Дописываем накопленные нераспознанные типы погоды в файл.
 
+        Если записать не удалось, счётчики возвращаются в память и будут
+        записаны в следующий раз
+        """
+        if not self.undefined:
+            return
+        undefined, self.undefined = self.undefined, Counter()
+        try:
+            await asyncio.to_thread(self._write, undefined)
+        except OSError:
+            self.undefined.update(undefined)
+            raise
 
-def _log_undefined_weather_type(weather_type):
-    """Запись типа погоды, для которого нет стикера"""
-    with open("undefined_weather_types.txt", "a") as f:
-        f.write(f"{weather_type}\n")
+    def _write(self, undefined):
+        with open(self.undefined_path, "a", encoding="u8") as f:
+            for weather_type, count in undefined.most_common():
+                f.write(f"{weather_type}\t{count}\n")
+
+
+@lru_cache(maxsize=None)
+def catalog():
+    """Каталог стикеров из `STICKERS_PATH`, загружается один раз"""
+    return StickerCatalog.from_file(
+        config.STICKERS_PATH, config.UNDEFINED_WEATHER_PATH
+    )
+
+
+def get_by_weather(weather_type):
+    """Случайный стикер по типу погоды, либо стикер нераспознанной погоды"""
+    return catalog().by_weather(weather_type)
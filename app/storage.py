@@ -0,0 +1,144 @@
+"""Хранилище состояний FSM в SQLite.
+
+Состояния выбора часа и минуты (`NewSub`, `ChangeTime`,
+`ChooseForecastHour`, `ChooseForecastDay`) хранятся в той же БД, что и
+подписчики. Поэтому их переживает перезапуск бота, и несколько процессов
+бота могут обслуживать одних и тех же пользователей.
+
+Запись идёт через тот же объект записи, что и у `Subscribers`, так что
+при групповом коммите изменения состояний копятся в общие пачки.
+По умолчанию состояние каждый раз читается из БД. Прочитанные состояния
+можно недолго (`cache_ttl` секунд) хранить в памяти процесса, но только
+если бот запущен одним процессом: изменения из других процессов кеш не
+видит. Состояние, которое не меняли дольше `ttl` секунд, считается
+устаревшим и удаляется
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from app.db import Autocommit
+
+
+class Entry(NamedTuple):
+    """Состояние и данные пользователя, прочитанные в `loaded_at`"""
+
+    state: Optional[str]
+    data: Dict[str, Any]
+    loaded_at: float
+
+
+class SqliteStorage(BaseStorage):
+    """Хранилище состояний FSM в таблице `fsm`"""
+
+    def __init__(
+        self,
+        session,
+        writes=None,
+        ttl=86400.0,
+        cache_ttl=0.0,
+        cache_size=10_000,
+        purge_interval=600.0,
+        clock=time.time,
+    ):
+        self.session = session
+        self.writes = Autocommit(session) if writes is None else writes
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.purge_interval = purge_interval
+        self.clock = clock
+        self.cache = OrderedDict()
+        self.purged_at = clock()
+
+    async def set_state(self, bot, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        entry = await self._entry(key)
+        await self._write(
+            "INSERT INTO fsm"
+            "(bot_id, chat_id, user_id, destiny, state, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(bot_id, chat_id, user_id, destiny) DO UPDATE SET "
+            "state = excluded.state, expires_at = excluded.expires_at",
+            key,
+            state,
+        )
+        self._remember(key, state, entry.data)
+
+    async def get_state(self, bot, key):
+        return (await self._entry(key)).state
+
+    async def set_data(self, bot, key, data):
+        entry = await self._entry(key)
+        await self._write(
+            "INSERT INTO fsm"
+            "(bot_id, chat_id, user_id, destiny, data, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(bot_id, chat_id, user_id, destiny) DO UPDATE SET "
+            "data = excluded.data, expires_at = excluded.expires_at",
+            key,
+            json.dumps(data),
+        )
+        self._remember(key, entry.state, dict(data))
+
+    async def get_data(self, bot, key):
+        return dict((await self._entry(key)).data)
+
+    async def close(self):
+        await self.writes.close()
+
+    async def purge(self):
+        """Удаляем устаревшие состояния"""
+        self.purged_at = self.clock()
+        await self.writes.execute(
+            "DELETE FROM fsm WHERE expires_at <= ?", (self.purged_at,)
+        )
+
+    async def _entry(self, key):
+        """Состояние из кеша или, если его там нет, из БД"""
+        now = self.clock()
+        entry = self.cache.get(key)
+        if entry is not None and now < entry.loaded_at + self.cache_ttl:
+            self.cache.move_to_end(key)
+            return entry
+
+        async with self.session.execute(
+            "SELECT state, data FROM fsm WHERE bot_id = ? AND chat_id = ? "
+            "AND user_id = ? AND destiny = ? AND expires_at > ?",
+            (key.bot_id, key.chat_id, key.user_id, key.destiny, now),
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return self._remember(key, None, {})
+        state, data = row
+        return self._remember(key, state, json.loads(data))
+
+    async def _write(self, sql, key, value):
+        """Записываем значение и продлеваем срок жизни состояния"""
+        now = self.clock()
+        await self.writes.execute(
+            sql,
+            (
+                key.bot_id,
+                key.chat_id,
+                key.user_id,
+                key.destiny,
+                value,
+                now + self.ttl,
+            ),
+        )
+        if now >= self.purged_at + self.purge_interval:
+            await self.purge()
+
+    def _remember(self, key, state, data):
+        """Кладём состояние в кеш, вытесняя самое давнее"""
+        entry = self.cache[key] = Entry(state, data, self.clock())
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return entry
@@ -1,11 +1,61 @@
-"""Модуль для работы с временем рассылки"""
+"""Модуль для работы с временем рассылки.
+
+Ожидание рассылки идёт по монотонным часам: время рассылки один раз
+переводится в момент монотонных часов процесса, поэтому ошибки не
+копятся от слота к слоту, а перевод системных часов не сдвигает
+рассылку
+"""
 
 import asyncio
+import time
 
 from more_itertools import iterate
 from placeholder import _
 
 from app.che import CheDatetime
+from app.logger import logger
+
+
+class MonotonicClock:
+    """Перевод времени рассылки в момент монотонных часов.
+
+    Соответствие между временем в Череповце и монотонными часами
+    запоминается один раз, при создании. Ожидание идёт через `sleep`,
+    чтобы в тестах часы и ожидание можно было подменить вместе
+    """
+
+    def __init__(
+        self,
+        now=CheDatetime.current,
+        monotonic=time.monotonic,
+        sleep=asyncio.sleep,
+    ):
+        self.monotonic = monotonic
+        self.sleep = sleep
+        self.anchor = now()
+        self.anchor_monotonic = monotonic()
+
+    def at(self, mailing_time):
+        """Момент монотонных часов, соответствующий времени рассылки"""
+        return (
+            self.anchor_monotonic
+            + (mailing_time - self.anchor).total_seconds()
+        )
+
+    def until(self, mailing_time):
+        """Секунд до времени рассылки, отрицательно - если оно прошло"""
+        return self.at(mailing_time) - self.monotonic()
+
+    def lateness(self, mailing_time):
+        """На сколько секунд мы опаздываем к времени рассылки"""
+        return max(0.0, -self.until(mailing_time))
+
+    async def sleep_until(self, mailing_time, lead=0.0):
+        """Ждём времени рассылки (без `lead` секунд)"""
+        await self.sleep(max(0.0, self.until(mailing_time) - lead))
+
+
+CLOCK = MonotonicClock()
 
 
 class MailingDatetimes:
@@ -22,11 +72,82 @@ class MailingDatetimes:
 class SleepBetween:
     """Поток времени рассылки, выдающий его только при наступлении"""
 
-    def __init__(self, origin):
+    def __init__(self, origin, clock=CLOCK):
         self.origin = origin
+        self.clock = clock
 
     async def __aiter__(self):
         """Выдаём время рассылки, только когда оно наступит"""
         for mailing_time in self.origin:
-            await asyncio.sleep(CheDatetime.current().until(mailing_time))
+            await self.clock.sleep_until(mailing_time)
+            yield mailing_time
+
+
+class SleepBefore:
+    """Поток времени рассылки, выдающий его за `lead` секунд до наступления.
+
+    Оставшееся время используется для подготовки рассылки
+    """
+
+    def __init__(self, origin, lead, clock=CLOCK):
+        self.origin = origin
+        self.lead = lead
+        self.clock = clock
+
+    async def __aiter__(self):
+        """Выдаём время рассылки за `lead` секунд до его наступления"""
+        for mailing_time in self.origin:
+            await self.clock.sleep_until(mailing_time, self.lead)
+            yield mailing_time
+
+
+class CatchUp:
+    """Поток времени рассылки, начинающийся с пропущенных рассылок.
+
+    `missed` - прошедшее время рассылки, которое стоит проверить, а
+    `pending(missed)` - то из него, рассылка которого не завершена
+    """
+
+    def __init__(self, origin, missed, pending):
+        self.origin = origin
+        self.missed = missed
+        self.pending = pending
+
+    async def __aiter__(self):
+        """Сначала пропущенные рассылки, затем обычные"""
+        try:
+            missed = await self.pending(self.missed)
+        except Exception:
+            missed = []
+            logger.exception("Не удалось найти пропущенные рассылки")
+        for mailing_time in missed:
+            logger.info("Догоняем пропущенную рассылку {}", mailing_time)
+            yield mailing_time
+        async for mailing_time in self.origin:
             yield mailing_time
+
+
+def missed_datetimes(now, delta, grace):
+    """Время рассылки за последние `grace` секунд, по порядку.
+
+    Время рассылки кратно `delta` от начала суток
+    """
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    last = day + (now - day) // delta * delta
+    missed = []
+    while last < now and (now - last).total_seconds() <= grace:
+        missed.append(last)
+        last -= delta
+    return missed[::-1]
+
+
+def next_datetime(now, delta):
+    """Ближайшее время рассылки, кратное `delta` от начала суток"""
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    passed = (now - day) // delta * delta
+    return day + passed if day + passed >= now else day + passed + delta
+
+
+async def sleep_until(mailing_time, clock=CLOCK):
+    """Ждём наступления времени рассылки"""
+    await clock.sleep_until(mailing_time)
@@ -1,29 +1,59 @@
 """API погоды"""
 
+import asyncio
+from bisect import bisect_right
+from functools import cached_property
 from urllib.parse import urlencode
 
-from async_lru import alru_cache
+import aiohttp
 from placeholder import _
 
-from app.forecasts import CurrentForecast, DailyForecast, HourlyForecast
-from app.weather_classes import WeatherResponse
+from app import config
+from app import metrics
+from app.cache import Fallback, StaleWhileRevalidate
+from app.forecasts import (
+    CurrentForecast,
+    DailyForecast,
+    HourlyForecast,
+    RenderedForecast,
+)
+from app.logger import logger
+from app.snapshot import Snapshot
+from app.weather_table import LazyWeatherResponse
 
 
 class OwmWeather:
     """Погода с OpenWeatherMap"""
 
-    def __init__(self, api):
+    def __init__(self, api, snapshot=None):
         self.api = api
+        self.snapshot = snapshot
+        self._index = None
 
     @classmethod
-    def from_url(cls, url, session, cache_time):
-        """Со ссылкой и временем жизни кеша"""
-        return cls(OwmApi(url, session, cache_time))
+    def from_url(cls, url, session, snapshot, soft_ttl, hard_ttl, jitter):
+        """Со ссылкой, снимком на диске и временами жизни кеша"""
+        return cls(
+            StaleWhileRevalidate(
+                Persisted(OwmApi(url, session), snapshot),
+                soft_ttl,
+                hard_ttl,
+                jitter,
+            ),
+            snapshot,
+        )
 
     @classmethod
-    def default(cls, url, session):
-        """Со значением времени жизни кеша по умолчанию"""
-        return cls.from_url(url, session, cache_time=300)
+    def default(cls, url, session, snapshot):
+        """Со значениями времени жизни кеша из конфига"""
+        return cls.from_url(
+            url,
+            session,
+            snapshot,
+            soft_ttl=config.WEATHER_SOFT_TTL,
+            hard_ttl=config.WEATHER_HARD_TTL,
+            jitter=config.WEATHER_REFRESH_JITTER,
+        )
 
     @classmethod
     def from_geo(cls, lat, lon, api_key, session):
@@ -38,83 +68,266 @@ class OwmWeather:
                 "lang": "ru",
             }
         )
-        return cls.default(url, session)
+        snapshot = Snapshot(
+            config.WEATHER_SNAPSHOT_PATH.format(lat=lat, lon=lon)
+        )
+        return cls.default(url, session, snapshot)
 
-    @classmethod
-    def for_che(cls, api_key, session):
-        """Для Череповца"""
-        return cls.from_geo(
-            lat=59.09, lon=37.91, api_key=api_key, session=session
+    async def restore(self):
+        """Прогреваем кеш последним ответом, сохранённым на диск"""
+        if self.snapshot is None:
+            return
+        saved = await self.snapshot.load()
+        if saved is None:
+            return
+        self.api.store(
+            LazyWeatherResponse(saved.data), self.api.clock() - saved.age
         )
+        logger.info("Кеш погоды восстановлен из снимка ({:.0f} с)", saved.age)
+
+    async def index(self):
+        """Индекс текущего ответа API.
+
+        Строится один раз на каждый новый ответ
+        """
+        weather = await self.api()
+        if self._index is None or self._index.weather is not weather:
+            self._index = WeatherIndex(weather)
+        return self._index
 
     async def current(self):
         """Текущая погода"""
-        weather = await self.api()
-        return CurrentForecast(weather.current, weather.alerts)
+        index = await self.index()
+        return CurrentForecast(index.weather.current, index.weather.alerts)
 
     async def hourly(self, timestamp):
         """Прогноз на час"""
-        weather = await self.api()
-        forecast = _next(weather.hourly, timestamp)
-        return HourlyForecast(forecast, weather.alerts)
+        index = await self.index()
+        forecast = index.hourly.next(timestamp)
+        return HourlyForecast(forecast, index.weather.alerts)
+
+    async def next_hours(self, timestamp, count):
+        """Прогнозы на `count` часов после `timestamp`"""
+        index = await self.index()
+        return [
+            HourlyForecast(forecast, index.weather.alerts)
+            for forecast in index.hourly.next_n(timestamp, count)
+        ]
 
     async def exact_hour(self, hour):
         """Прогноз на конкретный час"""
-        weather = await self.api()
-        forecast = _exact_hour(weather.hourly, hour)
-        return HourlyForecast(forecast, weather.alerts)
+        index = await self.index()
+        forecast = index.hourly.exact_hour(hour)
+        return HourlyForecast(forecast, index.weather.alerts)
 
     async def daily(self, timestamp):
         """Прогноз на день"""
-        weather = await self.api()
-        forecast = _next(weather.daily, timestamp)
-        return DailyForecast(forecast, weather.alerts)
+        index = await self.index()
+        forecast = index.daily.next(timestamp)
+        return DailyForecast(forecast, index.weather.alerts)
 
     async def exact_day(self, day):
         """Получение прогноза в конкретный день"""
-        weather = await self.api()
-        forecast = _exact_day(weather.daily, day)
-        return DailyForecast(forecast, weather.alerts)
+        index = await self.index()
+        forecast = index.daily.exact_day(day)
+        return DailyForecast(forecast, index.weather.alerts)
+
+
+class RenderedWeather:
+    """Погода с заранее отрисованными прогнозами.
+
+    Все прогнозы ответа API отрисовываются один раз при первом обращении
+    к нему, а дальше запрос прогноза - это поиск в словаре. Новый ответ
+    API приходит с новым индексом, поэтому старые тексты заменяются
+    все разом
+    """
+
+    def __init__(self, origin):
+        self.origin = origin
+
+    async def current(self):
+        """Текущая погода"""
+        index = await self.origin.index()
+        return index.rendered.current
+
+    async def hourly(self, timestamp):
+        """Прогноз на час"""
+        index = await self.origin.index()
+        return index.rendered.hours[index.hourly.next(timestamp).timestamp]
+
+    async def exact_hour(self, hour):
+        """Прогноз на конкретный час"""
+        index = await self.origin.index()
+        return index.rendered.hours[index.hourly.exact_hour(hour).timestamp]
+
+    async def daily(self, timestamp):
+        """Прогноз на день"""
+        index = await self.origin.index()
+        return index.rendered.days[index.daily.next(timestamp).timestamp]
+
+    async def exact_day(self, day):
+        """Получение прогноза в конкретный день"""
+        index = await self.origin.index()
+        return index.rendered.days[index.daily.exact_day(day).timestamp]
+
+
+class WeatherIndex:
+    """Индексы почасового и подневного прогнозов одного ответа API.
+
+    Каждый индекс строится при первом обращении к нему, чтобы не
+    разбирать лишние секции ответа
+    """
+
+    def __init__(self, weather):
+        self.weather = weather
+
+    @cached_property
+    def hourly(self):
+        """Индекс прогнозов по часам"""
+        return ForecastIndex(self.weather.hourly)
 
+    @cached_property
+    def daily(self):
+        """Индекс прогнозов по дням"""
+        return ForecastIndex(self.weather.daily)
 
-def _next(forecasts, timestamp):
-    """Поиск прогноза по времени.
+    @cached_property
+    def rendered(self):
+        """Отрисованные прогнозы этого ответа"""
+        return RenderedForecasts(self.weather)
 
-    OpenWeatherMap выдаёт сразу несколько прогнозов по часам/дням,
-    поэтому чтобы найти прогноз на ближайший час/день, фильтруем
-    те, что не раньше текущего момента (в запросе могут попасться
-    прогнозы на дату раньше текущей), и выбираем среди них наименьший
+
+class RenderedForecasts:
+    """Все прогнозы одного ответа API в текстовом виде.
+
+    Каждая секция отрисовывается целиком при первом обращении к ней
     """
-    key = _.timestamp
-    return min(filter(key > timestamp, forecasts), key=key)
 
+    def __init__(self, weather):
+        self.weather = weather
 
-def _exact_hour(forecasts, hour):
-    """Поиск прогноза на конкретный час"""
-    for forecast in forecasts:
-        if forecast.timestamp == hour:
-            return forecast
+    @cached_property
+    def current(self):
+        """Текущая погода"""
+        return RenderedForecast.of(
+            CurrentForecast(self.weather.current, self.weather.alerts)
+        )
 
+    @cached_property
+    def hours(self):
+        """Прогнозы по часам"""
+        return {
+            forecast.timestamp: RenderedForecast.of(
+                HourlyForecast(forecast, self.weather.alerts)
+            )
+            for forecast in self.weather.hourly
+        }
 
-def _exact_day(forecasts, day):
-    """Поиск прогноза на конкретный день"""
-    for forecast in forecasts:
-        if forecast.timestamp.date() == day:
-            return forecast
+    @cached_property
+    def days(self):
+        """Прогнозы по дням"""
+        return {
+            forecast.timestamp: RenderedForecast.of(
+                DailyForecast(forecast, self.weather.alerts)
+            )
+            for forecast in self.weather.daily
+        }
 
 
-def OwmApi(url, session, cache_time):
-    """OpenWeatherMap API.
+class ForecastIndex:
+    """Индекс прогнозов по времени.
 
-    Функция, а не класс, потому что не понимаю,
-    как красиво через класс сделать кеширование
+    OpenWeatherMap выдаёт сразу несколько прогнозов по часам/дням.
+    Вместо перебора всего списка на каждый запрос строим словари
+    час -> прогноз и дата -> прогноз, а также отсортированный массив
+    времён для поиска ближайшего прогноза бинарным поиском
     """
 
-    @alru_cache(maxsize=1, ttl=cache_time)
-    async def request():
-        """Кешированный прогноз погоды в виде WeatherResponse"""
-        async with session.get(url) as response:
-            data = await response.json()
-            return WeatherResponse(**data)
+    def __init__(self, forecasts):
+        self.forecasts = sorted(forecasts, key=_.timestamp)
+        self.timestamps = [
+            forecast.timestamp.timestamp() for forecast in self.forecasts
+        ]
+        self.by_hour = {}
+        self.by_date = {}
+        for forecast in self.forecasts:
+            self.by_hour.setdefault(forecast.timestamp, forecast)
+            self.by_date.setdefault(forecast.timestamp.date(), forecast)
+
+    def next(self, timestamp):
+        """Ближайший прогноз строго после `timestamp`.
+
+        В ответе могут попасться прогнозы на время раньше текущего,
+        поэтому ищем первый прогноз позже переданного момента
+        """
+        return self.forecasts[self._after(timestamp)]
+
+    def next_n(self, timestamp, count):
+        """Следующие `count` прогнозов строго после `timestamp`"""
+        start = self._after(timestamp)
+        return self.forecasts[start : start + count]
+
+    def exact_hour(self, hour):
+        """Прогноз на конкретный час"""
+        return self.by_hour.get(hour)
+
+    def exact_day(self, day):
+        """Прогноз на конкретный день"""
+        return self.by_date.get(day)
+
+    def _after(self, timestamp):
+        """Позиция первого прогноза строго после `timestamp`"""
+        return bisect_right(self.timestamps, timestamp.timestamp())
+
+
+class OwmApi:
+    """OpenWeatherMap API"""
+
+    def __init__(self, url, session):
+        self.url = url
+        self.session = session
+
+    async def __call__(self):
+        """Прогноз погоды в виде LazyWeatherResponse"""
+        return LazyWeatherResponse(await self.fetch())
+
+    @metrics.OWM_LATENCY.timed()
+    async def fetch(self):
+        """Прогноз погоды в виде JSON ответа"""
+        async with self.session.get(self.url) as response:
+            response.raise_for_status()
+            return await response.json()
+
+
+class Persisted:
+    """API погоды, сохраняющее каждый ответ на диск.
+
+    Если API недоступно, отдаём последний сохранённый ответ как запасные
+    данные `Fallback` с его настоящим возрастом
+    """
+
+    def __init__(self, api, snapshot):
+        self.api = api
+        self.snapshot = snapshot
+
+    async def __call__(self):
+        """Прогноз погоды в виде LazyWeatherResponse"""
+        try:
+            data = await self.api.fetch()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            saved = await self.snapshot.load()
+            if saved is None:
+                raise
+            logger.exception(
+                "API погоды недоступно, отдаём снимок ({:.0f} с)", saved.age
+            )
+            raise Fallback(
+                LazyWeatherResponse(saved.data), saved.age
+            ) from error
 
-    return request
+        response = LazyWeatherResponse(data)
+        try:
+            await self.snapshot.save(data)
+        except OSError:
+            logger.exception("Не удалось сохранить снимок погоды")
+        return response
@@ -162,6 +162,13 @@ def _is_english_alert(alert):
     return bool(set(alert.event) & set(ascii_letters))
 
 
+def russian_alerts(alerts):
+    """Только предупреждения, написанные на русском"""
+    if alerts is None:
+        return []
+    return [alert for alert in alerts if not _is_english_alert(alert)]
+
+
 class WeatherResponse(BaseModel):
     """Класс, преобразующий ответ с погодного сайта в python-структуру.
 
@@ -178,6 +185,4 @@ class WeatherResponse(BaseModel):
     @validator("alerts")
     def filter_alerts(cls, alerts):
         """Оставляем только предупрежденя написанные на русском"""
-        if alerts is None:
-            return []
-        return [alert for alert in alerts if not _is_english_alert(alert)]
+        return russian_alerts(alerts)
@@ -0,0 +1,335 @@
+"""Компактное представление ответа погодного API.
+
+Содержит LazyWeatherResponse - ленивый и компактный вариант WeatherResponse.
+
+Вместо списка pydantic-объектов с вложенными моделями прогнозы хранятся
+таблицей: каждое поле - отдельный типизированный массив (`array`), а
+описания погоды общие для всех таблиц (интернированы). Строка таблицы -
+лёгкое представление, которое читает и пишет значения прямо в массивы и
+подходит для шаблонов из `app.templates`
+"""
+
+import datetime as dt
+import math
+from array import array
+from collections.abc import Sequence
+from functools import cached_property, partial
+from typing import List, Optional
+
+from pydantic import parse_obj_as
+
+from app.weather_classes import (
+    Alert,
+    Weather,
+    WeatherDescription,
+    russian_alerts,
+)
+
+
+_WEATHER_TYPES = {}
+
+
+def _intern_weather_type(weather):
+    """Общее для всех таблиц описание погоды"""
+    key = (weather[0]["main"], weather[0]["description"])
+    if key not in _WEATHER_TYPES:
+        main, description = key
+        _WEATHER_TYPES[key] = WeatherDescription(
+            main=main, description=description
+        )
+    return _WEATHER_TYPES[key]
+
+
+class Column:
+    """Поле строки, хранящееся в массиве таблицы с тем же именем"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, row, owner=None):
+        if row is None:
+            return self
+        return self.load(getattr(row.table, self.name)[row.index], row)
+
+    def __set__(self, row, value):
+        getattr(row.table, self.name)[row.index] = self.dump(value, row)
+
+    def load(self, value, row):
+        """Значение из массива в значение поля"""
+        return value
+
+    def dump(self, value, row):
+        """Значение поля в значение для массива"""
+        return value
+
+
+class OptionalColumn(Column):
+    """Необязательное поле, отсутствие значения хранится как NaN"""
+
+    def load(self, value, row):
+        return None if math.isnan(value) else value
+
+    def dump(self, value, row):
+        return math.nan if value is None else value
+
+
+class TimestampColumn(Column):
+    """Время, хранящееся как UTC timestamp"""
+
+    def load(self, value, row):
+        return dt.datetime.fromtimestamp(value, dt.timezone.utc)
+
+    def dump(self, value, row):
+        return int(value.timestamp())
+
+
+class WeatherTypeColumn(Column):
+    """Описание погоды, хранящееся как номер в списке описаний таблицы"""
+
+    def load(self, value, row):
+        return row.table.types[value]
+
+    def dump(self, value, row):
+        return row.table.type_number(value)
+
+
+class Row:
+    """Строка таблицы прогнозов"""
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __eq__(self, other):
+        if not isinstance(other, Row):
+            return NotImplemented
+        return self.table is other.table and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.table), self.index))
+
+
+class BaseRow(Row):
+    """Общие поля прогнозов по часам и дням"""
+
+    __slots__ = ()
+
+    timestamp = TimestampColumn()
+    humidity = Column()
+    cloudiness = Column()
+    wind_speed = Column()
+    wind_gust = OptionalColumn()
+    weather_type = WeatherTypeColumn()
+
+
+class HourlyRow(BaseRow):
+    """Прогноз на час"""
+
+    __slots__ = ()
+
+    temp = Column()
+    feels_like = Column()
+
+
+class DailyTemperatureRow(Row):
+    """Действительная температура в течение дня"""
+
+    __slots__ = ()
+
+    morn_temp = Column()
+    day_temp = Column()
+    eve_temp = Column()
+    night_temp = Column()
+    min_temp = Column()
+    max_temp = Column()
+
+
+class DailyFeelsLikeRow(Row):
+    """Ощущаемая температура в течение дня"""
+
+    __slots__ = ()
+
+    morn_feels_like = Column()
+    day_feels_like = Column()
+    eve_feels_like = Column()
+    night_feels_like = Column()
+
+
+class DailyRow(BaseRow):
+    """Прогноз на день"""
+
+    __slots__ = ()
+
+    @property
+    def temp(self):
+        """Действительная температура в течение дня"""
+        return DailyTemperatureRow(self.table, self.index)
+
+    @property
+    def feels_like(self):
+        """Ощущаемая температура в течение дня"""
+        return DailyFeelsLikeRow(self.table, self.index)
+
+
+class Table(Sequence):
+    """Таблица прогнозов: по массиву на каждое поле.
+
+    Наследники задают класс строки `row` и поля `fields` в виде
+    (имя массива, тип массива, функция получения значения из JSON)
+    """
+
+    row = Row
+    fields = ()
+
+    def __init__(self, types, **columns):
+        self.types = types
+        for name, _, _ in self.fields:
+            setattr(self, name, columns[name])
+
+    @classmethod
+    def from_raw(cls, entries):
+        """Таблица из списка прогнозов в JSON ответа API"""
+        types = []
+        columns = {name: array(typecode) for name, typecode, _ in cls.fields}
+        table = cls(types, **columns)
+        for entry in entries:
+            for name, typecode, get in cls.fields:
+                convert = float if typecode == "d" else int
+                columns[name].append(convert(get(entry, table)))
+        return table
+
+    def type_number(self, weather_type):
+        """Номер описания погоды в таблице, с добавлением нового"""
+        for number, known in enumerate(self.types):
+            if known is weather_type:
+                return number
+        self.types.append(weather_type)
+        return len(self.types) - 1
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.row(self, index)
+
+
+def _field(key):
+    """Значение из JSON по ключу"""
+    return lambda entry, table: entry[key]
+
+
+def _nested_field(key, nested):
+    """Значение из вложенного объекта JSON"""
+    return lambda entry, table: entry[key][nested]
+
+
+def _optional_field(key):
+    """Необязательное значение из JSON, NaN при отсутствии"""
+    return lambda entry, table: (
+        math.nan if entry.get(key) is None else entry[key]
+    )
+
+
+def _weather_type_field(entry, table):
+    """Номер интернированного описания погоды"""
+    return table.type_number(_intern_weather_type(entry["weather"]))
+
+
+_BASE_FIELDS = (
+    ("timestamp", "q", _field("dt")),
+    ("humidity", "h", _field("humidity")),
+    ("cloudiness", "h", _field("clouds")),
+    ("wind_speed", "d", _field("wind_speed")),
+    ("wind_gust", "d", _optional_field("wind_gust")),
+    ("weather_type", "H", _weather_type_field),
+)
+
+
+class HourlyTable(Table):
+    """Прогнозы по часам"""
+
+    row = HourlyRow
+    fields = _BASE_FIELDS + (
+        ("temp", "d", _field("temp")),
+        ("feels_like", "d", _field("feels_like")),
+    )
+
+
+class DailyTable(Table):
+    """Прогнозы по дням"""
+
+    row = DailyRow
+    fields = _BASE_FIELDS + (
+        ("morn_temp", "d", _nested_field("temp", "morn")),
+        ("day_temp", "d", _nested_field("temp", "day")),
+        ("eve_temp", "d", _nested_field("temp", "eve")),
+        ("night_temp", "d", _nested_field("temp", "night")),
+        ("min_temp", "d", _nested_field("temp", "min")),
+        ("max_temp", "d", _nested_field("temp", "max")),
+        ("morn_feels_like", "d", _nested_field("feels_like", "morn")),
+        ("day_feels_like", "d", _nested_field("feels_like", "day")),
+        ("eve_feels_like", "d", _nested_field("feels_like", "eve")),
+        ("night_feels_like", "d", _nested_field("feels_like", "night")),
+    )
+
+
+class LazyWeatherResponse:
+    """Ответ с погодного сайта с разбором секций по требованию.
+
+    То же, что и `WeatherResponse`, но хранит исходный JSON и разбирает
+    каждую секцию (`current`, `hourly`, `daily`, `alerts`) только при
+    первом обращении к ней. Поэтому обновление кеша не тратит время на
+    разбор 48 часов и 8 дней, если нужна только текущая погода.
+    Успешно разобранная секция убирается из исходного JSON, а прогнозы по
+    часам и дням хранятся таблицами. Если секцию разобрать не удалось, она
+    остаётся в JSON, и следующее обращение снова выбросит ошибку разбора.
+
+    Наличие обязательных секций проверяется сразу, чтобы явно битый
+    ответ не попал в кеш
+    """
+
+    SECTIONS = ("current", "hourly", "daily")
+
+    def __init__(self, data):
+        missing = [section for section in self.SECTIONS if section not in data]
+        if missing:
+            raise ValueError(f"В ответе API нет секций: {missing}")
+        self.data = dict(data)
+
+    @cached_property
+    def current(self):
+        """Текущая погода"""
+        return self._parse("current", Weather.parse_obj)
+
+    @cached_property
+    def hourly(self):
+        """Прогнозы по часам"""
+        return self._parse("hourly", HourlyTable.from_raw)
+
+    @cached_property
+    def daily(self):
+        """Прогнозы по дням"""
+        return self._parse("daily", DailyTable.from_raw)
+
+    @cached_property
+    def alerts(self):
+        """Предупреждения на русском"""
+        return russian_alerts(
+            self._parse(
+                "alerts", partial(parse_obj_as, Optional[List[Alert]])
+            )
+        )
+
+    def _parse(self, section, parse):
+        """Разбираем секцию и только после этого убираем её из JSON"""
+        parsed = parse(self.data.get(section))
+        self.data.pop(section, None)
+        return parsed
@@ -0,0 +1,23 @@
+"""Бенчмарки бота.
+
+Каждый модуль запускается отдельно (`python -m benchmarks.db`), а
+`python -m benchmarks` запускает микробенчмарки горячих путей.
+Результаты выводятся JSON-строками, по строке на замер
+"""
+
+import json
+import timeit
+
+
+def measure(name, func):
+    """Замер функции без аргументов: наносекунд на вызов"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=3, number=number))
+    return {"name": name, "ns_per_op": best / number * 1e9, "ops": number}
+
+
+def report(results):
+    """Вывод результатов JSON-строками"""
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
@@ -0,0 +1,6 @@
+"""Запуск микробенчмарков горячих путей: `python -m benchmarks`"""
+
+from benchmarks import report
+from benchmarks.weather import run
+
+report(run())
@@ -0,0 +1,64 @@
+"""Бенчмарк `Subscribers.of_time` до и после индекса по времени рассылки.
+
+Запуск:
+
+~~~shell
+python -m benchmarks.db
+~~~
+
+Для каждого размера таблицы выводит JSON-строку со средним временем
+запроса в миллисекундах без индекса (`before`) и с ним (`after`)
+"""
+
+import asyncio
+import datetime as dt
+import json
+import random
+import time
+
+from app.db import MIGRATIONS, AiosqliteConnection, Subscribers, migrate
+
+
+SIZES = (10_000, 100_000, 1_000_000)
+REPEATS = 20
+
+MAILING_TIMES = [
+    dt.time(hour=hour, minute=minute)
+    for hour in range(6, 24)
+    for minute in range(0, 60, 15)
+]
+
+
+async def measure(db, repeats=REPEATS):
+    """Среднее время `of_time` в миллисекундах"""
+    start = time.perf_counter()
+    for mailing_time in random.choices(MAILING_TIMES, k=repeats):
+        list(await db.of_time(mailing_time))
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+async def bench(size):
+    """Замер на таблице из `size` подписчиков"""
+    async with AiosqliteConnection(":memory:") as session:
+        await migrate(session, MIGRATIONS[:1])
+        await session.executemany(
+            "INSERT INTO subscribers(id, mailing_time) VALUES(?, ?)",
+            ((i, random.choice(MAILING_TIMES)) for i in range(size)),
+        )
+        await session.commit()
+        db = Subscribers(session)
+
+        before = await measure(db)
+        await migrate(session)
+        after = await measure(db)
+
+    return {"rows": size, "before_ms": before, "after_ms": after}
+
+
+async def main():
+    for size in SIZES:
+        print(json.dumps(await bench(size)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+"""Поддельный Telegram Bot API для нагрузочного тестирования.
+
+Отвечает на методы, которыми пользуется бот (sendSticker, sendMessage,
+pinChatMessage, unpinChatMessage, unpinAllChatMessages, editMessageText,
+deleteMessage, getUpdates, setWebhook и др.), с настраиваемой задержкой.
+Как и настоящий API, отвечает 429 с `retry_after` при превышении общего
+лимита или лимита чата и 403 для пользователей, заблокировавших бота.
+
+Запуск отдельным сервером, на который можно направить бота через
+переменную окружения `TELEGRAM_API_URL=http://localhost:8081`:
+
+~~~shell
+python -m benchmarks.fake_telegram --port 8081 --latency 0.05
+~~~
+"""
+
+import argparse
+import asyncio
+import itertools
+import time
+from collections import Counter, defaultdict, deque
+
+from aiohttp import web
+
+
+class SlidingWindow:
+    """Не больше `limit` событий за последние `window` секунд"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.events = deque()
+
+    def allow(self, now):
+        """Можно ли ещё одно событие, и если да - учитываем его"""
+        while self.events and self.events[0] <= now - self.window:
+            self.events.popleft()
+        if len(self.events) >= self.limit:
+            return False
+        self.events.append(now)
+        return True
+
+
+class FakeTelegram:
+    """Поддельный Telegram Bot API.
+
+    - `latency` - задержка ответа в секундах;
+    - `global_limit` - запросов в секунду на всего бота;
+    - `chat_limit` и `chat_window` - запросов за окно на один чат;
+    - `retry_after` - что отвечать в `retry_after` при превышении лимита;
+    - `blocked` - чаты, заблокировавшие бота;
+    - `updates` - апдейты, которые отдаёт getUpdates.
+
+    Время первого запроса каждого метода (`time.monotonic`) сохраняется
+    в `first_requests`
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        global_limit=30,
+        chat_limit=4,
+        chat_window=1.0,
+        retry_after=1,
+        blocked=(),
+        updates=(),
+    ):
+        self.latency = latency
+        self.retry_after = retry_after
+        self.blocked = set(blocked)
+        self.updates = list(updates)
+        self.global_window = SlidingWindow(global_limit, 1.0)
+        self.chat_windows = defaultdict(
+            lambda: SlidingWindow(chat_limit, chat_window)
+        )
+        self.message_ids = itertools.count(1)
+        self.requests = Counter()
+        self.errors = Counter()
+        self.first_requests = {}
+        self.started = time.monotonic()
+
+    def app(self):
+        """aiohttp-приложение с API"""
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+    def stats(self):
+        """Статистика запросов"""
+        elapsed = time.monotonic() - self.started
+        total = sum(self.requests.values())
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "elapsed": elapsed,
+            "requests_per_second": total / elapsed if elapsed else 0.0,
+        }
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats())
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.requests[method] += 1
+        self.first_requests.setdefault(method, time.monotonic())
+        await asyncio.sleep(self.latency)
+
+        if method == "getUpdates":
+            offset = int(data.get("offset", 0))
+            updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not updates:
+                await asyncio.sleep(min(float(data.get("timeout", 0)), 1.0))
+            return _ok(updates)
+
+        chat_id = int(data["chat_id"]) if "chat_id" in data else None
+        if chat_id in self.blocked:
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        now = time.monotonic()
+        if not self.global_window.allow(now) or (
+            chat_id is not None and not self.chat_windows[chat_id].allow(now)
+        ):
+            return self._error(
+                429,
+                f"Too Many Requests: retry after {self.retry_after}",
+                parameters={"retry_after": self.retry_after},
+            )
+
+        return _ok(self._result(method, chat_id, data))
+
+    def _result(self, method, chat_id, data):
+        """Результат успешного вызова метода"""
+        if method == "getMe":
+            return {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "Fake",
+                "username": "fake_bot",
+            }
+        if method in ("sendMessage", "sendSticker", "editMessageText"):
+            message_id = data.get("message_id") or next(self.message_ids)
+            message = {
+                "message_id": int(message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+            }
+            if "text" in data:
+                message["text"] = data["text"]
+            return message
+        return True
+
+    def _error(self, code, description, parameters=None):
+        """Ответ с ошибкой в формате Bot API"""
+        self.errors[code] += 1
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters is not None:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+
+def _ok(result):
+    """Успешный ответ в формате Bot API"""
+    return web.json_response({"ok": True, "result": result})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--global-limit", type=int, default=30)
+    parser.add_argument("--chat-limit", type=int, default=4)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--blocked", type=int, nargs="*", default=())
+    args = parser.parse_args()
+
+    telegram = FakeTelegram(
+        latency=args.latency,
+        global_limit=args.global_limit,
+        chat_limit=args.chat_limit,
+        retry_after=args.retry_after,
+        blocked=args.blocked,
+    )
+    web.run_app(telegram.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Нагрузочный тест рассылки на поддельном Telegram Bot API.
+
+Запуск:
+
+~~~shell
+python -m benchmarks.mailing --subscribers 1000 --latency 0.05
+~~~
+
+Поднимает `benchmarks.fake_telegram` на свободном порту, заполняет
+базу в памяти подписчиками, часть из которых заблокировала бота, и
+отправляет им рассылку через `mailing.send_mailings` с диспетчером
+из конфига. Выводит JSON-строку с пропускной способностью рассылки и
+статистикой запросов поддельного сервера
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import random
+import time
+
+from aiohttp import web
+
+from app.bot.main import create_bot
+from app.db import AiosqliteConnection, Subscribers, migrate
+from app.dispatcher import MailingDispatcher
+from app.forecasts import RenderedForecast
+from app.mailing import send_mailings
+from benchmarks.fake_telegram import FakeTelegram
+
+
+MAILING_TIME = dt.time(hour=7)
+TOKEN = "123456:fake-token"
+
+
+class StaticWeather:
+    """Погода без обращения к OpenWeatherMap"""
+
+    async def current(self):
+        return RenderedForecast("Прогноз", "Clouds")
+
+
+async def bench(subscribers, blocked_share, telegram):
+    """Рассылка `subscribers` подписчикам через поддельный API"""
+    user_ids = range(1, subscribers + 1)
+    telegram.blocked = set(
+        random.sample(user_ids, int(subscribers * blocked_share))
+    )
+
+    runner = web.AppRunner(telegram.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    bot = create_bot(TOKEN, f"http://localhost:{port}")
+
+    try:
+        async with AiosqliteConnection(":memory:") as session:
+            await migrate(session)
+            db = Subscribers(session)
+            await session.executemany(
+                "INSERT INTO subscribers(id, mailing_time) VALUES(?, ?)",
+                ((user_id, MAILING_TIME) for user_id in user_ids),
+            )
+            await session.commit()
+
+            start = time.perf_counter()
+            await send_mailings(
+                bot,
+                db,
+                StaticWeather(),
+                MAILING_TIME,
+                MailingDispatcher.default(),
+            )
+            elapsed = time.perf_counter() - start
+            remaining = len(list(await db.of_time(MAILING_TIME)))
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+    return {
+        "subscribers": subscribers,
+        "blocked": len(telegram.blocked),
+        "pruned": subscribers - remaining,
+        "elapsed": elapsed,
+        "subscribers_per_second": subscribers / elapsed,
+        "telegram": telegram.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--blocked-share", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--global-limit", type=int, default=30)
+    parser.add_argument("--chat-limit", type=int, default=4)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    telegram = FakeTelegram(
+        latency=args.latency,
+        global_limit=args.global_limit,
+        chat_limit=args.chat_limit,
+        retry_after=args.retry_after,
+    )
+    result = asyncio.run(bench(args.subscribers, args.blocked_share, telegram))
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Бенчмарк разбора ответа OpenWeatherMap: целиком или по требованию.
+
+Запуск:
+
+~~~shell
+python -m benchmarks.parse
+~~~
+
+Для каждого способа разбора выводит JSON-строку со средним временем
+в миллисекундах, пиковой памятью и памятью, которую занимает результат,
+в килобайтах. `eager` и `lazy` - разбор ответа и получение текущей
+погоды, как при рассылке, `*_full` - разбор всех секций
+"""
+
+import json
+import time
+import tracemalloc
+
+from app.weather_classes import WeatherResponse
+from app.weather_table import LazyWeatherResponse
+
+
+REPEATS = 200
+
+
+def eager(data):
+    """Разбор всего ответа сразу"""
+    return WeatherResponse(**data).current
+
+
+def lazy(data):
+    """Разбор только секции текущей погоды"""
+    return LazyWeatherResponse(data).current
+
+
+def eager_full(data):
+    """Разбор всего ответа"""
+    return WeatherResponse(**data)
+
+
+def lazy_full(data):
+    """Разбор всех секций ленивого ответа в таблицы"""
+    response = LazyWeatherResponse(data)
+    for section in ("current", "hourly", "daily", "alerts"):
+        getattr(response, section)
+    return response
+
+
+def measure(parse, data, repeats=REPEATS):
+    """Среднее время в миллисекундах и память в килобайтах"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        parse(data)
+    elapsed = (time.perf_counter() - start) / repeats * 1000
+
+    tracemalloc.start()
+    result = parse(data)  # noqa: F841 - держим результат до замера
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "parse": parse.__name__,
+        "ms": elapsed,
+        "peak_kb": peak / 1024,
+        "retained_kb": retained / 1024,
+    }
+
+
+def main():
+    with open("tests/response.json", encoding="u8") as f:
+        data = json.load(f)
+    for parse in (eager, lazy, eager_full, lazy_full):
+        print(json.dumps(measure(parse, data)))
+
+
+if __name__ == "__main__":
+    main()
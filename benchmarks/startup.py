@@ -0,0 +1,179 @@
+"""Профиль запуска бота: время импорта по модулям и время до первого апдейта.
+
+Запуск:
+
+~~~shell
+python -m benchmarks.startup --top 15
+~~~
+
+Время импорта снимается через `python -X importtime` в отдельном
+процессе. Собственное время модулей суммируется по пакетам верхнего
+уровня, а для модулей `app` выводится время вместе с зависимостями,
+которые они импортировали первыми.
+
+Время до первого апдейта - от запуска `python -m app` в режиме polling
+на поддельном Telegram Bot API (`benchmarks.fake_telegram`) до ответа
+бота на `/start`. Также выводится время до первых getMe и getUpdates
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+from benchmarks import report
+from benchmarks.fake_telegram import FakeTelegram
+
+
+TOKEN = "123456:fake-token"
+START_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 10, "type": "private"},
+        "from": {"id": 10, "is_bot": False, "first_name": "User"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+def import_times(module):
+    """Строки `python -X importtime`: модуль, собственное и общее время
+    в микросекундах
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_profile(module, top):
+    """Время импорта `module`: всего, по пакетам и по модулям `app`"""
+    rows = import_times(module)
+    packages = defaultdict(int)
+    modules = Counter()
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        packages[package] += self_us
+        modules[package] += 1
+    total = next(cum for name, _, cum in rows if name == module)
+
+    results = [{"name": f"import {module}", "ms": total / 1000}]
+    for package, self_us in sorted(
+        packages.items(), key=lambda item: item[1], reverse=True
+    )[:top]:
+        results.append(
+            {
+                "name": f"package {package}",
+                "self_ms": self_us / 1000,
+                "modules": modules[package],
+            }
+        )
+    for name, self_us, cumulative_us in rows:
+        if name == "app" or name.startswith("app."):
+            results.append(
+                {
+                    "name": f"module {name}",
+                    "self_ms": self_us / 1000,
+                    "ms": cumulative_us / 1000,
+                }
+            )
+    return results
+
+
+async def time_to_first_update(timeout):
+    """Запуск бота на поддельном API до ответа на `/start`"""
+    telegram = FakeTelegram(global_limit=1000, updates=[START_UPDATE])
+    runner = web.AppRunner(telegram.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "BOT_TOKEN": TOKEN,
+            "WEATHER_API_KEY": "fake",
+            "RUN_TYPE": "polling",
+            "METRICS_PORT": "0",
+            "TELEGRAM_API_URL": f"http://localhost:{port}",
+            "DATABASE_URL": os.path.join(tmp, "subscribers.db"),
+            "WEATHER_SNAPSHOT_PATH": os.path.join(
+                tmp, "weather_{lat}_{lon}.json.gz"
+            ),
+        }
+        started = time.monotonic()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "app",
+            env=env,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            deadline = started + timeout
+            while "sendMessage" not in telegram.first_requests:
+                exited = process.returncode is not None
+                if time.monotonic() > deadline or exited:
+                    raise RuntimeError("Бот не ответил на /start")
+                await asyncio.sleep(0.005)
+        finally:
+            process.terminate()
+            await process.wait()
+            await runner.cleanup()
+
+    def since_start(method):
+        return telegram.first_requests[method] - started
+
+    return {
+        "name": "time_to_first_update",
+        "get_me_s": since_start("getMe"),
+        "get_updates_s": since_start("getUpdates"),
+        "first_reply_s": since_start("sendMessage"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app.bot.main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--imports-only",
+        action="store_true",
+        help="без запуска бота на поддельном API",
+    )
+    args = parser.parse_args()
+
+    report(import_profile(args.module, args.top))
+    if not args.imports_only:
+        report(
+            asyncio.run(time_to_first_update(args.timeout))
+            for _ in range(args.runs)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Микробенчмарки погоды: разбор ответа, поиск и форматирование прогнозов,
+стикеры и клавиатуры.
+
+Работают без сети, на ответе API из `tests/response.json`.
+
+Запуск:
+
+~~~shell
+python -m benchmarks.weather
+~~~
+"""
+
+import datetime as dt
+import json
+
+from app import keyboards
+from app import stickers
+from app.forecasts import CurrentForecast, DailyForecast, HourlyForecast
+from app.weather import WeatherIndex
+from app.weather_classes import WeatherResponse
+from app.weather_table import LazyWeatherResponse
+from benchmarks import measure, report
+
+
+def _load_response():
+    with open("tests/response.json", encoding="u8") as f:
+        return json.load(f)
+
+
+def _timestamp(timestamp):
+    return dt.datetime.fromtimestamp(timestamp, dt.timezone.utc)
+
+
+def run():
+    """Все замеры"""
+    data = _load_response()
+    response = LazyWeatherResponse(data)
+    index = WeatherIndex(response)
+
+    # current.dt, один из hourly.dt и один из daily.dt в response.json
+    now = _timestamp(1641528599)
+    hour = _timestamp(1641535200)
+    day = _timestamp(1641632400).date()
+
+    current = CurrentForecast(response.current, response.alerts)
+    hourly = HourlyForecast(index.hourly.next(now), response.alerts)
+    daily = DailyForecast(index.daily.next(now), response.alerts)
+
+    return [
+        measure("parse.eager", lambda: WeatherResponse(**data)),
+        measure(
+            "parse.lazy_current", lambda: LazyWeatherResponse(data).current
+        ),
+        measure(
+            "parse.hourly_table", lambda: LazyWeatherResponse(data).hourly
+        ),
+        measure("parse.daily_table", lambda: LazyWeatherResponse(data).daily),
+        measure("index.build", lambda: WeatherIndex(response).hourly),
+        measure("index.next_hour", lambda: index.hourly.next(now)),
+        measure("index.next_day", lambda: index.daily.next(now)),
+        measure("index.exact_hour", lambda: index.hourly.exact_hour(hour)),
+        measure("index.exact_day", lambda: index.daily.exact_day(day)),
+        measure("index.next_12_hours", lambda: index.hourly.next_n(now, 12)),
+        measure("format.current", current.format),
+        measure("format.hourly", hourly.format),
+        measure("format.daily", daily.format),
+        measure(
+            "stickers.get_by_weather",
+            lambda: stickers.get_by_weather("Clouds"),
+        ),
+        measure("keyboards.main", keyboards.MainKeyboard),
+        measure("keyboards.hour_choice", keyboards.HourChoiceKeyboard),
+        measure("keyboards.minute_choice", keyboards.MinuteChoiceKeyboard),
+        measure(
+            "keyboards.forecast_hour", keyboards.ForecastHourChoice.current
+        ),
+        measure("keyboards.forecast_day", keyboards.ForecastDayChoice.current),
+    ]
+
+
+if __name__ == "__main__":
+    report(run())
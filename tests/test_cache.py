@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from app.cache import Fallback, StaleWhileRevalidate
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeFetch:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise ConnectionError
+        return self.calls
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def fetch():
+    return FakeFetch()
+
+
+@pytest.fixture
+def cache(fetch, clock):
+    return StaleWhileRevalidate(fetch, soft_ttl=10, hard_ttl=60, clock=clock)
+
+
+@pytest.mark.asyncio
+async def test_single_flight(cache, fetch):
+    values = await asyncio.gather(*(cache() for _ in range(10)))
+
+    assert values == [1] * 10
+    assert fetch.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_hit(cache, fetch, clock):
+    await cache()
+    clock.now = 5
+
+    assert await cache() == 1
+    assert fetch.calls == 1
+    assert cache.stats.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_served_while_refreshing(cache, fetch, clock):
+    await cache()
+    clock.now = 20
+
+    assert await cache() == 1
+    assert await cache() == 1
+    await cache.refreshing
+
+    assert await cache() == 2
+    assert fetch.calls == 2
+    assert cache.stats.stale == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_value(cache, fetch, clock):
+    await cache()
+    clock.now = 20
+    fetch.fail = True
+
+    assert await cache() == 1
+    with pytest.raises(ConnectionError):
+        await cache.refreshing
+
+    assert await cache() == 1
+    assert cache.stats.failures == 1
+    assert fetch.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_hard_ttl_waits_for_refresh(cache, fetch, clock):
+    await cache()
+    clock.now = 100
+
+    assert await cache() == 2
+    assert cache.stats.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_freshness(cache, fetch, clock):
+    await cache()
+    clock.now = 20
+
+    async def stale_fallback():
+        raise Fallback(0, age=100)
+
+    cache.fetch = stale_fallback
+    assert await cache._refresh() == 1
+
+    assert cache.fetched_at == 0
+    assert cache.stats.failures == 1
+    assert cache.stats.refreshes == 1
@@ -1,18 +1,21 @@
 import asyncio
 import datetime as dt
+import sqlite3
 
 import pytest
 import pytest_asyncio
 
 from app.db import (
+    MIGRATIONS,
     AiosqliteConnection,
+    GroupCommit,
     Subscriber,
     Subscribers,
     UserNotFound,
     create_db,
+    migrate,
 )
 
-
 mailing_time = dt.time(hour=18, minute=45)
 
 
@@ -72,3 +75,130 @@ async def test_delete(session):
     after = await db.of_time(mailing_time)
 
     assert list(before) == list(after)
+
+
+@pytest.mark.asyncio
+async def test_delete_many(session):
+    db = Subscribers(session)
+
+    for user_id in range(5):
+        await db.add(user_id=user_id, mailing_time=mailing_time)
+    await db.delete_many([0, 2, 4])
+
+    assert [sub.id for sub in await db.of_time(mailing_time)] == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_migrations_applied_once(session):
+    await create_db(session)
+
+    async with session.execute("SELECT version FROM schema_version") as cur:
+        versions = [version for (version,) in await cur.fetchall()]
+
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
+
+
+@pytest.mark.asyncio
+async def test_failed_migration_rolled_back(tmp_path):
+    path = tmp_path / "subscribers.db"
+    migrations = (
+        "CREATE TABLE a (x INTEGER)",
+        "ALTER TABLE a ADD COLUMN y INTEGER",
+        "ALTER TABLE missing ADD COLUMN z INTEGER",
+    )
+    async with AiosqliteConnection(path) as session:
+        with pytest.raises(sqlite3.OperationalError):
+            await migrate(session, migrations)
+
+        await migrate(session, migrations[:2])
+        async with session.execute(
+            "SELECT max(version) FROM schema_version"
+        ) as cur:
+            assert await cur.fetchone() == (2,)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_migrations(tmp_path):
+    path = tmp_path / "subscribers.db"
+    async with AiosqliteConnection(path) as first, AiosqliteConnection(
+        path
+    ) as second:
+        await asyncio.gather(create_db(first), create_db(second))
+
+        async with first.execute("SELECT version FROM schema_version") as cur:
+            versions = [version for (version,) in await cur.fetchall()]
+
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
+
+
+@pytest.mark.asyncio
+async def test_of_time_uses_index(session):
+    async with session.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM subscribers WHERE mailing_time = ?",
+        (mailing_time,),
+    ) as cursor:
+        plan = await cursor.fetchall()
+
+    assert "ix_subscribers_mailing_time" in str(plan)
+
+
+@pytest.mark.asyncio
+async def test_group_commit(session):
+    db = Subscribers.with_group_commit(session, delay=0.01, max_batch=100)
+    commits = 0
+    commit = session.commit
+
+    async def counting_commit():
+        nonlocal commits
+        commits += 1
+        await commit()
+
+    session.commit = counting_commit
+    await asyncio.gather(
+        *(db.add(user_id=i, mailing_time=mailing_time) for i in range(10))
+    )
+
+    assert commits == 1
+    assert len(list(await db.of_time(mailing_time))) == 10
+
+
+@pytest.mark.asyncio
+async def test_group_commit_error_is_per_change(session):
+    db = Subscribers.with_group_commit(session, delay=0.01, max_batch=100)
+
+    results = await asyncio.gather(
+        db.add(user_id=0, mailing_time=mailing_time),
+        db.add(user_id=0, mailing_time=mailing_time),
+        db.add(user_id=1, mailing_time=mailing_time),
+        return_exceptions=True,
+    )
+
+    assert results[0] is None
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert results[2] is None
+    assert len(list(await db.of_time(mailing_time))) == 2
+
+
+@pytest.mark.asyncio
+async def test_group_commit_close_waits_for_running_commit(session):
+    writes = GroupCommit(session, delay=0, max_batch=100)
+    committing = asyncio.Event()
+    committed = False
+    commit = session.commit
+
+    async def slow_commit():
+        nonlocal committed
+        committing.set()
+        await asyncio.sleep(0.01)
+        await commit()
+        committed = True
+
+    session.commit = slow_commit
+    adding = asyncio.create_task(
+        Subscribers(session, writes).add(user_id=0, mailing_time=mailing_time)
+    )
+    await committing.wait()
+    await writes.close()
+
+    assert committed
+    await adding
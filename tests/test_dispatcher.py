@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app.dispatcher import MailingDispatcher, TokenBucket
+
+
+class FakeBot:
+    def __init__(self, flood_chats=(), blocked_chats=()):
+        self.flood_chats = set(flood_chats)
+        self.blocked_chats = set(blocked_chats)
+        self.sent = []
+        self.running = 0
+        self.max_running = 0
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.flood_chats:
+            self.flood_chats.remove(chat_id)
+            raise TelegramRetryAfter(
+                SendMessage(chat_id=chat_id, text=text), "", retry_after=0
+            )
+        if chat_id in self.blocked_chats:
+            raise TelegramForbiddenError(
+                SendMessage(chat_id=chat_id, text=text), "bot was blocked"
+            )
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        self.sent.append(chat_id)
+
+
+async def send(bot, user_id):
+    await bot.send_message(user_id, "Прогноз")
+
+
+@pytest.mark.asyncio
+async def test_sends_concurrently():
+    bot = FakeBot()
+    dispatcher = MailingDispatcher.from_rates(
+        workers=4, rate=1000, chat_rate=1000, chat_burst=1
+    )
+
+    report = await dispatcher.run(bot, range(20), send)
+
+    assert sorted(bot.sent) == list(range(20))
+    assert bot.max_running == 4
+    assert report.delivered == 20
+    assert report.failed == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_after():
+    bot = FakeBot(flood_chats={3})
+    dispatcher = MailingDispatcher.from_rates(
+        workers=2, rate=1000, chat_rate=1000, chat_burst=1
+    )
+
+    report = await dispatcher.run(bot, range(5), send)
+
+    assert sorted(bot.sent) == list(range(5))
+    assert report.retries == 1
+    assert report.calls == 6
+
+
+@pytest.mark.asyncio
+async def test_blocked_users_collected():
+    bot = FakeBot(blocked_chats={1, 3})
+    dispatcher = MailingDispatcher.from_rates(
+        workers=2, rate=1000, chat_rate=1000, chat_burst=1
+    )
+
+    report = await dispatcher.run(bot, range(5), send)
+
+    assert sorted(report.blocked) == [1, 3]
+    assert report.delivered == 3
+    assert report.failed == 0
+
+
+@pytest.mark.asyncio
+async def test_failure_does_not_stop_mailing():
+    async def failing(bot, user_id):
+        if user_id == 0:
+            raise RuntimeError
+        await send(bot, user_id)
+
+    bot = FakeBot()
+    dispatcher = MailingDispatcher.from_rates(
+        workers=1, rate=1000, chat_rate=1000, chat_burst=1
+    )
+
+    report = await dispatcher.run(bot, range(3), failing)
+
+    assert bot.sent == [1, 2]
+    assert report.failed == 1
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    now = 0.0
+    bucket = TokenBucket(rate=10, capacity=5, clock=lambda: now)
+
+    for _ in range(5):
+        await bucket.acquire()
+    assert bucket.tokens == 0
+
+    now = 0.3
+    await bucket.acquire()
+    assert bucket.tokens == pytest.approx(2)
+
+
+@pytest.mark.asyncio
+async def test_steady_bucket_within_rate_every_second():
+    clock = [0.0]
+
+    async def sleep(seconds):
+        clock[0] += seconds
+
+    bucket = TokenBucket.steady(32, clock=lambda: clock[0], sleep=sleep)
+    acquired = []
+    for _ in range(100):
+        await bucket.acquire()
+        acquired.append(clock[0])
+
+    assert all(
+        sum(start <= moment < start + 1 for moment in acquired) <= 32
+        for start in acquired
+    )
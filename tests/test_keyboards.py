@@ -0,0 +1,36 @@
+import datetime as dt
+
+from app import keyboards
+from app.che import CheDate, CheDatetime
+
+
+def test_static_keyboards_built_once():
+    assert keyboards.MainKeyboard.default() is keyboards.MainKeyboard.default()
+    assert (
+        keyboards.HourChoiceKeyboard.default()
+        is keyboards.HourChoiceKeyboard.default()
+    )
+    assert (
+        keyboards.MinuteChoiceKeyboard.default()
+        is keyboards.MinuteChoiceKeyboard.default()
+    )
+
+
+def test_forecast_hour_choice_cached_per_hour():
+    hour = CheDatetime(2000, 1, 1, 7)
+    later = hour + dt.timedelta(hours=1)
+
+    first = keyboards.ForecastHourChoice.from_hour(hour)
+
+    assert keyboards.ForecastHourChoice.from_hour(hour) is first
+    assert keyboards.ForecastHourChoice.from_hour(later) is not first
+    assert first.inline_keyboard[0][0].text == "08:00"
+
+
+def test_forecast_day_choice_cached_per_day():
+    day = CheDate(2000, 1, 1)
+
+    first = keyboards.ForecastDayChoice.from_day(day)
+
+    assert keyboards.ForecastDayChoice.from_day(day) is first
+    assert keyboards.ForecastDayChoice.current() is not first
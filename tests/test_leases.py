@@ -0,0 +1,133 @@
+import asyncio
+import datetime as dt
+
+import pytest
+import pytest_asyncio
+
+from app.db import AiosqliteConnection, create_db
+from app.dispatcher import SlotReport
+from app.leases import Leases
+from app.mailing import PreparedMailing, send_sharded
+
+
+mailing_datetime = dt.datetime(2000, 1, 1, 7, 0)
+slot = "2000-01-01 07:00"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest_asyncio.fixture
+async def sessions(tmp_path):
+    """Два соединения с одной БД, как у двух процессов бота"""
+    path = tmp_path / "subscribers.db"
+    async with AiosqliteConnection(path) as first, AiosqliteConnection(
+        path
+    ) as second:
+        await create_db(first)
+        yield first, second
+
+
+@pytest.mark.asyncio
+async def test_shards_split_between_processes(sessions):
+    first, second = (
+        Leases(session, shards=4, ttl=60, wait=0, owner=str(i))
+        for i, session in enumerate(sessions)
+    )
+
+    claimed = [
+        await first.acquire(slot),
+        await second.acquire(slot),
+        await first.acquire(slot),
+        await second.acquire(slot),
+    ]
+
+    assert sorted(claimed) == [0, 1, 2, 3]
+    assert await first.acquire(slot) is None
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_taken_over(sessions):
+    clock = Clock()
+    crashed, survivor = (
+        Leases(session, shards=1, ttl=60, wait=0, owner=str(i), clock=clock)
+        for i, session in enumerate(sessions)
+    )
+
+    assert await crashed.acquire(slot) == 0
+    assert await survivor.acquire(slot) is None
+
+    clock.now += 60
+    assert await survivor.acquire(slot) == 0
+    async with survivor.holding(slot, 0):
+        pass
+
+    clock.now += 60
+    assert await crashed.acquire(slot) is None
+
+
+class FakeDb:
+    async def delete_many(self, user_ids):
+        pass
+
+    async def delivered(self, mailing_date, mailing_time):
+        return set()
+
+    async def purge_deliveries(self, before):
+        pass
+
+
+class RecordingDispatcher:
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def run(self, bot, user_ids, send):
+        await asyncio.sleep(0.01)
+        self.sent.extend(user_ids)
+        return SlotReport(len(user_ids), 0, (), len(user_ids), 0, 0.01)
+
+
+@pytest.mark.asyncio
+async def test_each_subscriber_mailed_once(sessions):
+    sent = []
+    prepared = PreparedMailing(
+        mailing_time=mailing_datetime.time(),
+        message_text="Прогноз",
+        sticker="sticker",
+        subscribers=list(range(100)),
+    )
+
+    await asyncio.gather(
+        *(
+            send_sharded(
+                None,
+                FakeDb(),
+                prepared,
+                RecordingDispatcher(sent),
+                Leases(session, shards=8, ttl=60, wait=1, owner=str(i)),
+                mailing_datetime,
+            )
+            for i, session in enumerate(sessions)
+        )
+    )
+
+    assert sorted(sent) == list(range(100))
+
+
+@pytest.mark.asyncio
+async def test_pending_slots(sessions):
+    leases = Leases(sessions[0], shards=1, ttl=60, wait=0)
+    done = mailing_datetime
+    started = mailing_datetime + dt.timedelta(minutes=15)
+    missed = mailing_datetime + dt.timedelta(minutes=30)
+
+    async with leases.holding(slot, await leases.acquire(slot)):
+        pass
+    await leases.acquire("2000-01-01 07:15")
+
+    assert await leases.pending([done, started, missed]) == [started, missed]
@@ -0,0 +1,44 @@
+from app.locations import CHE, GridCell, WeatherRegistry
+
+
+def test_snap_close_places_to_same_cell():
+    assert GridCell.snap(59.09, 37.91, 0.1) == GridCell.snap(59.12, 37.88, 0.1)
+    assert GridCell.snap(59.09, 37.91, 0.1) != GridCell.snap(59.2, 37.91, 0.1)
+
+
+def test_cell_center():
+    cell = GridCell.snap(59.09, 37.91, 0.1)
+
+    assert (cell.lat, cell.lon) == (59.1, 37.9)
+
+
+def test_same_weather_for_same_cell():
+    registry = WeatherRegistry("key", None, cell_size=0.1, max_cells=2)
+
+    assert registry.for_geo(59.09, 37.91) is registry.for_geo(59.11, 37.93)
+    assert len(registry.cells) == 1
+
+
+def test_least_recently_used_cell_evicted():
+    registry = WeatherRegistry("key", None, cell_size=0.1, max_cells=2)
+
+    che = registry.for_che()
+    vologda = registry.for_geo(59.22, 39.89)
+    assert registry.for_che() is che
+    registry.for_geo(55.75, 37.62)
+
+    assert len(registry.cells) == 2
+    assert registry.for_che() is che
+    assert registry.for_geo(59.22, 39.89) is not vologda
+
+
+def test_che_cell_never_evicted():
+    registry = WeatherRegistry("key", None, cell_size=0.1, max_cells=2)
+
+    che = registry.for_che()
+    registry.for_geo(59.22, 39.89)
+    registry.for_geo(55.75, 37.62)
+    registry.for_geo(59.94, 30.31)
+
+    assert len(registry.cells) == 2
+    assert registry.for_geo(*CHE) is che
@@ -0,0 +1,21 @@
+from app import config
+from app.logger import not_dropped, sample
+
+
+def test_sampled_records_dropped(monkeypatch):
+    monkeypatch.setattr(config, "LOG_SAMPLE_RATE", 0.0)
+    record = {"extra": {}}
+
+    sample(record)
+
+    assert not not_dropped(record)
+    assert not_dropped({"extra": {}})
+
+
+def test_all_records_kept_by_default(monkeypatch):
+    monkeypatch.setattr(config, "LOG_SAMPLE_RATE", 1.0)
+    record = {"extra": {}}
+
+    sample(record)
+
+    assert not_dropped(record)
@@ -1,6 +1,33 @@
+import asyncio
 import datetime as dt
+import heapq
+import itertools
+import sqlite3
+import time
 
-from app.times import MailingDatetimes
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from app.bot.main import create_bot
+from app.che import CheDatetime
+from app.db import AiosqliteConnection, Subscriber, Subscribers, create_db
+from app.dispatcher import MailingDispatcher, SlotReport
+from app.mailing import (
+    mailing,
+    prepare_mailing,
+    send_mailings,
+    send_prepared,
+)
+from app.times import (
+    CatchUp,
+    MailingDatetimes,
+    MonotonicClock,
+    SleepBefore,
+    missed_datetimes,
+    next_datetime,
+)
+from benchmarks.fake_telegram import FakeTelegram
 
 
 def test_mailing_times_same_delta():
@@ -15,3 +42,339 @@ def test_mailing_times_same_delta():
         first = next(mailing_times)
         second = next(mailing_times)
         assert (second - first) == delta
+
+
+class VirtualTime:
+    """Виртуальное время для тестов рассылки.
+
+    Часы стоят, пока задачам есть чем заняться, и переводятся к
+    ближайшему пробуждению, только когда все они спят. Поэтому
+    результат не зависит от загрузки машины
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+        self.order = itertools.count()
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        future = asyncio.get_running_loop().create_future()
+        wakeup = (self.now + delay, next(self.order), future)
+        heapq.heappush(self.timers, wakeup)
+        await future
+
+    def clock(self, start):
+        """Часы рассылки, на которых сейчас `start`"""
+        return MonotonicClock(
+            now=lambda: start, monotonic=self.monotonic, sleep=self.sleep
+        )
+
+    async def run(self, until):
+        """Даём задачам поработать до момента `until`"""
+        while True:
+            for _ in range(100):
+                await asyncio.sleep(0)
+            if not self.timers or self.timers[0][0] > until:
+                break
+            self.now, _, future = heapq.heappop(self.timers)
+            if not future.done():
+                future.set_result(None)
+        self.now = until
+
+
+class FakeForecast:
+    def format(self):
+        return "Прогноз"
+
+    def sticker(self):
+        return "sticker"
+
+
+class FakeWeather:
+    def __init__(self, events, monotonic=time.monotonic):
+        self.events = events
+        self.monotonic = monotonic
+
+    async def current(self):
+        self.events.append(("prepare", self.monotonic()))
+        return FakeForecast()
+
+
+class FakeDb:
+    async def of_time(self, mailing_time):
+        return [Subscriber(id=0, mailing_time=mailing_time)]
+
+    async def delivered(self, mailing_date, mailing_time):
+        return set()
+
+    async def purge_deliveries(self, before):
+        pass
+
+
+class FakeDispatcher:
+    def __init__(self, events, monotonic):
+        self.events = events
+        self.monotonic = monotonic
+
+    async def run(self, bot, user_ids, send):
+        self.events.append(("send", self.monotonic()))
+        raise asyncio.CancelledError
+
+
+@pytest.mark.asyncio
+async def test_mailing_prepared_before_slot():
+    events = []
+    virtual = VirtualTime()
+    start = CheDatetime(2000, 1, 1, 7)
+    clock = virtual.clock(start)
+    times = SleepBefore(
+        MailingDatetimes(
+            start + dt.timedelta(seconds=0.3), dt.timedelta(hours=1)
+        ),
+        0.2,
+        clock=clock,
+    )
+    task = asyncio.create_task(
+        mailing(
+            None,
+            FakeDb(),
+            FakeWeather(events, virtual.monotonic),
+            times,
+            FakeDispatcher(events, virtual.monotonic),
+            clock=clock,
+        )
+    )
+    await virtual.run(until=1)
+
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert events == [
+        ("prepare", pytest.approx(0.1)),
+        ("send", pytest.approx(0.3)),
+    ]
+
+
+@pytest_asyncio.fixture
+async def telegram_mailing():
+    """Поддельный Telegram API, бот и БД с тремя подписчиками"""
+    telegram = FakeTelegram(global_limit=1000, chat_limit=10, blocked={2})
+    runner = web.AppRunner(telegram.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    bot = create_bot("123456:fake-token", f"http://localhost:{port}")
+
+    try:
+        async with AiosqliteConnection(":memory:") as session:
+            await create_db(session)
+            db = Subscribers(session)
+            for user_id in (1, 2, 3):
+                await db.add(user_id, fake_mailing_time)
+            yield telegram, bot, db
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+
+fake_mailing_time = dt.time(hour=7)
+fake_dispatcher = MailingDispatcher.from_rates(
+    workers=2, rate=1000, chat_rate=1000, chat_burst=4
+)
+
+
+class BrokenTimes:
+    async def __aiter__(self):
+        raise RuntimeError
+        yield
+
+
+@pytest.mark.asyncio
+async def test_mailing_times_error_raised():
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(
+            mailing(None, FakeDb(), FakeWeather([]), BrokenTimes(), None), 1
+        )
+
+
+@pytest.mark.asyncio
+async def test_send_mailings_through_fake_telegram(telegram_mailing):
+    telegram, bot, db = telegram_mailing
+
+    await send_mailings(
+        bot, db, FakeWeather([]), fake_mailing_time, fake_dispatcher
+    )
+    subscribers = await db.of_time(fake_mailing_time)
+
+    assert [subscriber.id for subscriber in subscribers] == [1, 3]
+    assert telegram.requests["pinChatMessage"] == 2
+    assert "unpinAllChatMessages" not in telegram.requests
+    assert "unpinChatMessage" not in telegram.requests
+    assert telegram.errors[403] == 1
+
+
+@pytest.mark.asyncio
+async def test_pin_mode_unpins_only_previous_forecast(telegram_mailing):
+    telegram, bot, db = telegram_mailing
+
+    for day in (1, 2):
+        prepared = await prepare_mailing(
+            db, FakeWeather([]), fake_mailing_time, dt.date(2000, 1, day)
+        )
+        await send_prepared(bot, db, prepared, fake_dispatcher, "pin")
+    subscribers = list(await db.of_time(fake_mailing_time))
+
+    assert telegram.requests["unpinAllChatMessages"] == 2
+    assert telegram.requests["unpinChatMessage"] == 2
+    assert all(
+        subscriber.pinned_message_id > prepared.pinned[subscriber.id]
+        for subscriber in subscribers
+    )
+
+
+@pytest.mark.asyncio
+async def test_pin_mode_none_halves_requests(telegram_mailing):
+    telegram, bot, db = telegram_mailing
+
+    prepared = await prepare_mailing(db, FakeWeather([]), fake_mailing_time)
+    await send_prepared(bot, db, prepared, fake_dispatcher, "none")
+
+    assert sorted(telegram.requests) == ["sendMessage", "sendSticker"]
+
+
+@pytest.mark.asyncio
+async def test_slot_rerun_sends_only_to_unserved(telegram_mailing):
+    telegram, bot, db = telegram_mailing
+    mailing_date = dt.date(2000, 1, 1)
+    await db.record_deliveries(mailing_date, fake_mailing_time, [1])
+
+    for _ in range(2):
+        prepared = await prepare_mailing(
+            db, FakeWeather([]), fake_mailing_time, mailing_date
+        )
+        await send_prepared(bot, db, prepared, fake_dispatcher, batch=1)
+
+    assert telegram.requests["sendMessage"] == 1
+    assert await db.delivered(mailing_date, fake_mailing_time) == {1, 3}
+
+
+def test_monotonic_clock():
+    start = dt.datetime(2000, 1, 1, 7, 0)
+    now = [100.0]
+    clock = MonotonicClock(now=lambda: start, monotonic=lambda: now[0])
+
+    slot = start + dt.timedelta(minutes=15)
+    assert clock.until(slot) == 900
+    now[0] += 1000
+    assert clock.lateness(slot) == 100
+
+
+def test_missed_and_next_datetimes():
+    now = dt.datetime(2000, 1, 1, 7, 40)
+    delta = dt.timedelta(minutes=15)
+
+    assert missed_datetimes(now, delta, grace=1800) == [
+        dt.datetime(2000, 1, 1, 7, 15),
+        dt.datetime(2000, 1, 1, 7, 30),
+    ]
+    assert next_datetime(now, delta) == dt.datetime(2000, 1, 1, 7, 45)
+    assert next_datetime(now.replace(minute=45), delta) == now.replace(
+        minute=45
+    )
+
+
+@pytest.mark.asyncio
+async def test_catch_up_pending_slots_first():
+    missed = [dt.datetime(2000, 1, 1, 7, 15), dt.datetime(2000, 1, 1, 7, 30)]
+
+    async def pending(slots):
+        return slots[1:]
+
+    async def origin():
+        yield dt.datetime(2000, 1, 1, 7, 45)
+
+    slots = [slot async for slot in CatchUp(origin(), missed, pending)]
+
+    assert [slot.minute for slot in slots] == [30, 45]
+
+
+@pytest.mark.asyncio
+async def test_catch_up_skipped_when_pending_fails():
+    async def pending(slots):
+        raise sqlite3.OperationalError
+
+    async def origin():
+        yield dt.datetime(2000, 1, 1, 7, 45)
+
+    missed = [dt.datetime(2000, 1, 1, 7, 30)]
+    slots = [slot async for slot in CatchUp(origin(), missed, pending)]
+
+    assert [slot.minute for slot in slots] == [45]
+
+
+class SlowDispatcher:
+    def __init__(self, duration, virtual):
+        self.duration = duration
+        self.virtual = virtual
+        self.started = []
+
+    async def run(self, bot, user_ids, send):
+        self.started.append(self.virtual.monotonic())
+        await self.virtual.sleep(self.duration)
+        return SlotReport(0, 0, (), 0, 0, self.duration)
+
+
+async def _overrun_starts(overlap):
+    """Начала рассылок, каждая из которых длится два интервала"""
+    virtual = VirtualTime()
+    dispatcher = SlowDispatcher(0.2, virtual)
+    start = CheDatetime(2000, 1, 1, 7)
+    clock = virtual.clock(start)
+    times = SleepBefore(
+        MailingDatetimes(
+            start + dt.timedelta(seconds=0.05), dt.timedelta(seconds=0.1)
+        ),
+        0,
+        clock=clock,
+    )
+    task = asyncio.create_task(
+        mailing(
+            None,
+            FakeDb(),
+            FakeWeather([], virtual.monotonic),
+            times,
+            dispatcher,
+            overlap=overlap,
+            clock=clock,
+        )
+    )
+    await virtual.run(until=0.5)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    return [started - 0.05 for started in dispatcher.started]
+
+
+@pytest.mark.asyncio
+async def test_overlap_concurrent_starts_on_time():
+    starts = await _overrun_starts("concurrent")
+
+    assert starts[:4] == pytest.approx([0, 0.1, 0.2, 0.3])
+
+
+@pytest.mark.asyncio
+async def test_overlap_queue_waits_for_previous():
+    starts = await _overrun_starts("queue")
+
+    assert starts[:2] == pytest.approx([0, 0.2])
+
+
+@pytest.mark.asyncio
+async def test_overlap_merge_sends_due_slots_together():
+    starts = await _overrun_starts("merge")
+
+    # Вторая рассылка ушла после первой, а третья - вместе со второй
+    assert starts[:3] == pytest.approx([0, 0.2, 0.2])
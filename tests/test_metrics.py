@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.bot.handlers import Info
+from app.metrics import Counter, HandlerMetrics, Histogram, Registry
+
+
+def test_histogram_render():
+    registry = Registry()
+    histogram = registry.register(
+        Histogram(
+            "latency_seconds",
+            "Задержка",
+            labels=("route",),
+            buckets=(0.1, 1.0),
+        )
+    )
+
+    histogram.observe(0.05, route="Info")
+    histogram.observe(0.5, route="Info")
+    histogram.observe(5, route="Info")
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Задержка",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="Info",le="0.1"} 1.0',
+        'latency_seconds_bucket{route="Info",le="1.0"} 2.0',
+        'latency_seconds_bucket{route="Info",le="+Inf"} 3.0',
+        'latency_seconds_sum{route="Info"} 5.55',
+        'latency_seconds_count{route="Info"} 3.0',
+    ]
+
+
+def test_counter_labels_escaped():
+    registry = Registry()
+    counter = registry.register(Counter("errors_total", "Ошибки", ("type",)))
+
+    counter.inc(type='Bad"Error')
+    counter.inc(2, type='Bad"Error')
+
+    assert 'errors_total{type="Bad\\"Error"} 3.0' in registry.render()
+
+
+@pytest.mark.asyncio
+async def test_handler_latency_by_route(monkeypatch):
+    histogram = Histogram("handler_seconds", "", labels=("route",))
+    monkeypatch.setattr("app.metrics.HANDLER_LATENCY", histogram)
+
+    async def handler(event, data):
+        return "ok"
+
+    data = {"handler": SimpleNamespace(callback=Info().handle)}
+    result = await HandlerMetrics()(handler, None, data)
+
+    assert result == "ok"
+    assert sum(histogram.counts[("Info",)]) == 1
@@ -0,0 +1,117 @@
+import json
+
+import aiohttp
+import pytest
+
+from app.cache import Fallback, StaleWhileRevalidate
+from app.snapshot import Snapshot
+from app.weather import OwmWeather, Persisted
+
+
+def _load_response():
+    with open("tests/response.json", encoding="u8") as f:
+        return json.load(f)
+
+
+class FakeApi:
+    def __init__(self, data=None):
+        self.data = data
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        if self.data is None:
+            raise aiohttp.ClientConnectionError
+        return self.data
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return Snapshot(tmp_path / "weather.json.gz")
+
+
+@pytest.mark.asyncio
+async def test_save_and_load(snapshot):
+    data = _load_response()
+
+    await snapshot.save(data, fetched_at=100.0)
+    saved = await snapshot.load()
+
+    assert saved.data == data
+    assert saved.fetched_at == 100.0
+
+
+@pytest.mark.asyncio
+async def test_load_missing(snapshot):
+    assert await snapshot.load() is None
+
+
+@pytest.mark.asyncio
+async def test_response_persisted(snapshot):
+    data = _load_response()
+    api = Persisted(FakeApi(data), snapshot)
+
+    await api()
+
+    assert (await snapshot.load()).data == data
+
+
+@pytest.mark.asyncio
+async def test_response_returned_when_save_fails(tmp_path):
+    data = _load_response()
+    api = Persisted(FakeApi(data), Snapshot(tmp_path / "missing" / "w.gz"))
+
+    response = await api()
+
+    assert response.current.temp == -9.08
+
+
+@pytest.mark.asyncio
+async def test_snapshot_used_when_api_unreachable(snapshot):
+    await snapshot.save(_load_response())
+    api = Persisted(FakeApi(), snapshot)
+
+    with pytest.raises(Fallback) as fallback:
+        await api()
+
+    assert fallback.value.value.current.temp == -9.08
+
+
+@pytest.mark.asyncio
+async def test_snapshot_keeps_its_age(snapshot):
+    await snapshot.save(_load_response(), fetched_at=0.0)
+    cache = StaleWhileRevalidate(
+        Persisted(FakeApi(), snapshot), soft_ttl=300, hard_ttl=3600
+    )
+
+    response = await cache()
+
+    assert response.current.temp == -9.08
+    assert cache.clock() - cache.fetched_at > 3600
+    assert cache.stats.failures == 1
+    assert cache.stats.refreshes == 0
+
+
+@pytest.mark.asyncio
+async def test_unreachable_without_snapshot(snapshot):
+    api = Persisted(FakeApi(), snapshot)
+
+    with pytest.raises(aiohttp.ClientError):
+        await api()
+
+
+@pytest.mark.asyncio
+async def test_restore_warms_cache(snapshot):
+    await snapshot.save(_load_response())
+    api = FakeApi(_load_response())
+    cache = StaleWhileRevalidate(
+        Persisted(api, snapshot), soft_ttl=300, hard_ttl=3600
+    )
+    weather = OwmWeather(cache, snapshot)
+
+    await weather.restore()
+    forecast = await weather.current()
+
+    assert forecast.forecast.temp == -9.08
+    assert api.calls == 0
+    assert cache.stats.hits == 1
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from app.stickers import StickerCatalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "stickers.json"
+    path.write_text(
+        json.dumps(
+            {
+                "maintainceSticker": "maintaince",
+                "undefinedWeatherStickers": ["undefined"],
+                "weatherTypes": {"Clouds": ["clouds"]},
+            }
+        ),
+        encoding="u8",
+    )
+    return StickerCatalog.from_file(path, tmp_path / "undefined.txt")
+
+
+def test_stickers_by_weather(catalog):
+    assert catalog.by_weather("Clouds") == "clouds"
+    assert catalog.by_weather("Ash") == "undefined"
+    assert catalog.weather_types["Clouds"] == ("clouds",)
+
+
+@pytest.mark.asyncio
+async def test_undefined_types_flushed_aggregated(catalog):
+    for weather_type in ("Ash", "Ash", "Squall"):
+        catalog.by_weather(weather_type)
+
+    await catalog.flush()
+    await catalog.flush()
+
+    assert catalog.undefined_path.read_text(encoding="u8") == (
+        "Ash\t2\nSquall\t1\n"
+    )
+
+
+@pytest.mark.asyncio
+async def test_undefined_types_kept_when_write_fails(catalog, tmp_path):
+    undefined_path = catalog.undefined_path
+    catalog.undefined_path = tmp_path
+    catalog.by_weather("Ash")
+
+    with pytest.raises(OSError):
+        await catalog.flush()
+    catalog.by_weather("Ash")
+    catalog.undefined_path = undefined_path
+    await catalog.flush()
+
+    assert undefined_path.read_text(encoding="u8") == "Ash\t2\n"
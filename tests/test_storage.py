@@ -0,0 +1,79 @@
+import pytest
+import pytest_asyncio
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from app.bot.handlers import NewSub
+from app.db import AiosqliteConnection, create_db
+from app.storage import SqliteStorage
+
+
+key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest_asyncio.fixture
+async def session():
+    async with AiosqliteConnection(":memory:") as session:
+        await create_db(session)
+        yield session
+
+
+def _context(storage):
+    return FSMContext(bot=None, storage=storage, key=key)
+
+
+@pytest.mark.asyncio
+async def test_state_and_data(session):
+    state = _context(SqliteStorage(session))
+
+    await state.set_state(NewSub.hour)
+    await state.update_data(hour=7)
+
+    assert await state.get_state() == NewSub.hour.state
+    assert await state.get_data() == {"hour": 7}
+
+    await state.clear()
+
+    assert await state.get_state() is None
+    assert await state.get_data() == {}
+
+
+@pytest.mark.asyncio
+async def test_shared_between_storages(session):
+    first = SqliteStorage(session)
+    second = SqliteStorage(session)
+
+    await _context(first).set_state(NewSub.hour)
+    assert await _context(second).get_state() == NewSub.hour.state
+    await _context(first).set_state(NewSub.minute)
+    await _context(first).update_data(hour=7)
+
+    assert await _context(second).get_state() == NewSub.minute.state
+    assert await _context(second).get_data() == {"hour": 7}
+
+
+@pytest.mark.asyncio
+async def test_expired_state_dropped(session):
+    clock = Clock()
+    storage = SqliteStorage(
+        session, ttl=60, cache_ttl=0, purge_interval=600, clock=clock
+    )
+
+    await _context(storage).set_state(NewSub.hour)
+    clock.now += 60
+
+    assert await _context(storage).get_state() is None
+
+    clock.now += 600
+    other = StorageKey(bot_id=1, chat_id=11, user_id=11)
+    await storage.set_state(None, other, NewSub.hour)
+    async with session.execute("SELECT count(*) FROM fsm") as cursor:
+        assert await cursor.fetchone() == (1,)
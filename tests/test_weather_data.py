@@ -1,11 +1,14 @@
 import json
 import datetime as dt
+from operator import attrgetter
 
 import pytest
 from async_lru import alru_cache
+from pydantic import ValidationError
 
 from app.weather import OwmWeather
 from app.weather_classes import WeatherResponse
+from app.weather_table import LazyWeatherResponse
 
 
 class FakeApi:
@@ -120,3 +123,105 @@ async def test_exact_day(day_timestamp):
 
     assert forecast_data.temp.day_temp == -15.74
     assert forecast_data.feels_like.day_feels_like == -21.9
+
+
+@pytest.mark.asyncio
+async def test_next_hours(timestamp):
+    weather = OwmWeather(FakeApi())
+
+    forecasts = await weather.next_hours(timestamp, 3)
+    first = await weather.hourly(timestamp)
+
+    assert len(forecasts) == 3
+    assert forecasts[0].forecast == first.forecast
+    hours = [forecast.forecast.timestamp for forecast in forecasts]
+    assert hours == sorted(hours)
+    assert hours[1] - hours[0] == dt.timedelta(hours=1)
+
+
+@pytest.mark.asyncio
+async def test_index_built_once_per_response():
+    weather = OwmWeather(FakeApi())
+
+    assert await weather.index() is await weather.index()
+
+
+BASE_FIELDS = (
+    "timestamp",
+    "humidity",
+    "cloudiness",
+    "wind_speed",
+    "wind_gust",
+    "weather_type",
+)
+HOURLY_FIELDS = BASE_FIELDS + ("temp", "feels_like")
+DAILY_FIELDS = BASE_FIELDS + (
+    "temp.morn_temp",
+    "temp.day_temp",
+    "temp.eve_temp",
+    "temp.night_temp",
+    "temp.min_temp",
+    "temp.max_temp",
+    "feels_like.morn_feels_like",
+    "feels_like.day_feels_like",
+    "feels_like.eve_feels_like",
+    "feels_like.night_feels_like",
+)
+
+
+def _fields(forecasts, fields):
+    return [attrgetter(*fields)(forecast) for forecast in forecasts]
+
+
+def test_lazy_response_same_as_eager():
+    with open("tests/response.json", encoding="u8") as f:
+        data = json.load(f)
+
+    eager = WeatherResponse(**data)
+    lazy = LazyWeatherResponse(data)
+
+    assert lazy.current == eager.current
+    assert lazy.alerts == eager.alerts
+    assert _fields(lazy.hourly, HOURLY_FIELDS) == _fields(
+        eager.hourly, HOURLY_FIELDS
+    )
+    assert _fields(lazy.daily, DAILY_FIELDS) == _fields(
+        eager.daily, DAILY_FIELDS
+    )
+
+
+def test_lazy_response_parses_on_access():
+    with open("tests/response.json", encoding="u8") as f:
+        lazy = LazyWeatherResponse(json.load(f))
+
+    assert lazy.current.temp == -9.08
+    assert "current" in vars(lazy)
+    assert "hourly" not in vars(lazy)
+    assert "daily" not in vars(lazy)
+
+
+def test_lazy_response_requires_sections():
+    with pytest.raises(ValueError):
+        LazyWeatherResponse({"current": {}})
+
+
+def test_lazy_response_keeps_invalid_section():
+    with open("tests/response.json", encoding="u8") as f:
+        data = json.load(f)
+    data["current"] = {"temp": "warm"}
+    lazy = LazyWeatherResponse(data)
+
+    for _ in range(2):
+        with pytest.raises(ValidationError):
+            attrgetter("current")(lazy)
+
+
+def test_table_row_is_writable():
+    with open("tests/response.json", encoding="u8") as f:
+        hourly = LazyWeatherResponse(json.load(f)).hourly
+
+    hour = hourly[0]
+    hour.wind_gust = None
+    assert hour.wind_gust is None
+    hour.wind_gust = 10.0
+    assert hourly[0].wind_gust == 10.0
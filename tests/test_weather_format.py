@@ -6,7 +6,7 @@ import datetime as dt
 import pytest
 from async_lru import alru_cache
 
-from app.weather import OwmWeather
+from app.weather import OwmWeather, RenderedWeather
 from app.weather_classes import WeatherResponse
 
 
@@ -81,3 +81,39 @@ async def test_stickers(timestamp):
         without_wind_gust.forecast.wind_gust = None
 
         assert without_wind_gust.format() != with_wind_gust.format()
+
+
+@pytest.mark.asyncio
+async def test_rendered_same_as_format(timestamp):
+    weather = OwmWeather(FakeApi())
+    rendered = RenderedWeather(weather)
+
+    forecasts = await asyncio.gather(
+        weather.current(),
+        weather.hourly(timestamp),
+        weather.exact_hour(_create_timestamp(1641535200)),
+        weather.daily(timestamp),
+        weather.exact_day(_create_timestamp(1641632400).date()),
+    )
+    rendered_forecasts = await asyncio.gather(
+        rendered.current(),
+        rendered.hourly(timestamp),
+        rendered.exact_hour(_create_timestamp(1641535200)),
+        rendered.daily(timestamp),
+        rendered.exact_day(_create_timestamp(1641632400).date()),
+    )
+
+    assert [forecast.format() for forecast in forecasts] == [
+        forecast.format() for forecast in rendered_forecasts
+    ]
+    assert [forecast.forecast.weather_type.main for forecast in forecasts] == [
+        forecast.weather_type for forecast in rendered_forecasts
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rendered_once_per_response(timestamp):
+    rendered = RenderedWeather(OwmWeather(FakeApi()))
+
+    assert await rendered.current() is await rendered.current()
+    assert await rendered.hourly(timestamp) is await rendered.hourly(timestamp)
@@ -0,0 +1,102 @@
+import asyncio
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from app.bot.webhook import QueuedRequestHandler, ShardedUpdates
+
+
+def _message_update(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+
+
+class Recorder:
+    def __init__(self, release):
+        self.release = release
+        self.handled = []
+
+    async def handle(self, message):
+        await self.release.wait()
+        self.handled.append((message.chat.id, message.text))
+
+
+@pytest_asyncio.fixture
+async def webhook():
+    release = asyncio.Event()
+    recorder = Recorder(release)
+    dp = Dispatcher()
+    dp.message()(recorder.handle)
+    bot = Bot("123456:fake-token")
+    updates = ShardedUpdates(dp, bot, workers=2, queue_size=2)
+    app = web.Application()
+    QueuedRequestHandler(dp, bot, updates).register(app, path="/webhook")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    async with aiohttp.ClientSession() as session:
+
+        async def post(update):
+            async with session.post(
+                f"http://localhost:{port}/webhook", json=update
+            ) as response:
+                return response.status
+
+        yield post, release, recorder, updates
+    release.set()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_acknowledged_before_handling(webhook):
+    post, release, recorder, updates = webhook
+
+    assert await post(_message_update(1, 10, "first")) == 200
+    assert recorder.handled == []
+
+    release.set()
+    await updates.close()
+    assert recorder.handled == [(10, "first")]
+
+
+@pytest.mark.asyncio
+async def test_chat_order_kept(webhook):
+    post, release, recorder, updates = webhook
+
+    for update_id, text in enumerate(("a", "b")):
+        await post(_message_update(update_id, 10, text))
+    await post(_message_update(2, 11, "c"))
+    release.set()
+    await updates.close()
+
+    assert [text for chat, text in recorder.handled if chat == 10] == [
+        "a",
+        "b",
+    ]
+    assert (11, "c") in recorder.handled
+
+
+@pytest.mark.asyncio
+async def test_full_shard_rejected(webhook):
+    post, release, recorder, updates = webhook
+
+    statuses = [
+        await post(_message_update(update_id, 10, "text"))
+        for update_id in range(4)
+    ]
+
+    # Первый апдейт уже у воркера, ещё два ждут в шарде
+    assert statuses == [200, 200, 200, 503]